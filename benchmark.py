@@ -0,0 +1,385 @@
+import json
+import logging
+import os
+import platform
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+from combinatorial_bnb import ColoringBnBCliqueSolver
+from heuristic import GreedyHeuristic
+from independent_sets import IndependentSetGenerator
+from utils import read_graph
+
+try:
+    from bnb_max_clique import BnBCliqueSolver, CliqueSolver
+except ImportError:  # No CPLEX, only the CPLEX-free stages can be run
+    BnBCliqueSolver = CliqueSolver = None
+
+# Stages which are summed up to compare with the end-to-end times of main.py outputs
+END_TO_END_STAGES = [
+    "read_graph",
+    "greedy_heuristic",
+    "independent_sets",
+    "construct_problem",
+    "bnb",
+]
+
+
+def run_read_graph(path, context, args):
+    start = perf_counter()
+    graph = read_graph(path, use_cache=False)
+    elapsed = perf_counter() - start
+    context["graph"] = graph
+    return elapsed, {"vertices": graph.number_of_nodes()}
+
+
+def run_read_graph_cached(path, context, args):
+    read_graph(path)  # Writes the cache, if there is none
+    start = perf_counter()
+    read_graph(path)
+    return perf_counter() - start, {}
+
+
+def run_greedy_heuristic(path, context, args):
+    start = perf_counter()
+    context["heuristic"] = GreedyHeuristic(context["graph"], seed=args.seed)()
+    return perf_counter() - start, {"clique_size": context["heuristic"][1]}
+
+
+def get_heuristic_solution(context, args):
+    """
+    B&B stages start from the seeded heuristic solution, so they are reproducible
+    """
+    if "heuristic" not in context:
+        context["heuristic"] = GreedyHeuristic(context["graph"], seed=args.seed)()
+    return context["heuristic"]
+
+
+def run_coloring_classes(path, context, args):
+    """
+    Deterministic colorings of the independent set generation, they need no LP
+    """
+    start = perf_counter()
+    generator = IndependentSetGenerator(context["graph"], float("inf"), seed=args.seed)
+    independent_sets = generator.collect(generator.deterministic_classes(), set())
+    return perf_counter() - start, {"independent_sets": len(independent_sets)}
+
+
+def run_coloring_bnb(path, context, args):
+    solver = ColoringBnBCliqueSolver(context["graph"], args.time_limit)
+    solution, objective_value = get_heuristic_solution(context, args)
+    solver.set_solution(solution)
+    solver.set_objective_value(objective_value)
+    try:
+        elapsed = solver()[1] / 1000
+    except TimeoutError:
+        elapsed = args.time_limit
+    return (
+        elapsed,
+        {
+            "clique_size": solver.get_objective_value(),
+            "finished": solver.get_gap() == 0,
+            "nodes": solver.call_times,
+            "nodes_per_sec": solver.get_nodes_per_second(),
+        },
+    )
+
+
+def run_independent_sets(path, context, args):
+    solver = CliqueSolver(context["graph"], "LP", args.time_limit, seed=args.seed)
+    context["independent_sets"] = solver.independent_sets
+    return (
+        solver.phase_times["independent_sets"],
+        {"independent_sets": len(solver.independent_sets)},
+    )
+
+
+def get_independent_sets(context, args):
+    if "independent_sets" not in context:
+        solver = CliqueSolver(context["graph"], "LP", args.time_limit, seed=args.seed)
+        context["independent_sets"] = solver.independent_sets
+    return context["independent_sets"]
+
+
+def run_construct_problem(path, context, args):
+    """
+    Model construction with the independent sets given, so they aren't generated. Adding
+    their rows is timed as independent_sets, it isn't included
+    """
+    solver = CliqueSolver(
+        context["graph"],
+        "LP",
+        args.time_limit,
+        independent_sets=get_independent_sets(context, args),
+        seed=args.seed,
+    )
+    return (
+        solver.phase_times["construct_problem"],
+        {"rows": solver.problem.linear_constraints.get_num()},
+    )
+
+
+def run_bnb(path, context, args):
+    solver = BnBCliqueSolver(
+        context["graph"],
+        "LP",
+        args.time_limit,
+        independent_sets=get_independent_sets(context, args),
+        seed=args.seed,
+    )
+    solution, objective_value = get_heuristic_solution(context, args)
+    solver.set_solution(solution)
+    solver.set_objective_value(objective_value)
+    start = perf_counter()
+    try:
+        solver()
+    except TimeoutError:
+        pass
+    return (
+        perf_counter() - start,
+        {
+            "clique_size": solver.get_objective_value(),
+            "finished": solver.get_gap() == 0,
+            "nodes": solver.call_times,
+            "nodes_per_sec": solver.get_nodes_per_second(),
+        },
+    )
+
+
+# name: (function, needs CPLEX), in the order of running
+STAGES = {
+    "read_graph": (run_read_graph, False),
+    "read_graph_cached": (run_read_graph_cached, False),
+    "greedy_heuristic": (run_greedy_heuristic, False),
+    "coloring_classes": (run_coloring_classes, False),
+    "coloring_bnb": (run_coloring_bnb, False),
+    "independent_sets": (run_independent_sets, True),
+    "construct_problem": (run_construct_problem, True),
+    "bnb": (run_bnb, True),
+}
+
+
+def benchmark_graph(path, stages, args):
+    """
+    Runs every stage repeats times, metrics are taken from the last run
+    """
+    context = {}
+    results = {}
+    for stage in stages:
+        function = STAGES[stage][0]
+        times = []
+        for _ in range(args.repeats):
+            elapsed, metrics = function(path, context, args)
+            times.append(elapsed)
+        results[stage] = {
+            "times": times,
+            "min": min(times),
+            "median": median(times),
+            **metrics,
+        }
+        logging.info(
+            f"{os.path.basename(path)} {stage}: median {results[stage]['median']:.4f} secs, "
+            f"min {results[stage]['min']:.4f} secs {metrics}",
+        )
+    return results
+
+
+def is_slower(new, old, args):
+    return new > old * (1 + args.threshold) and new - old > args.min_difference
+
+
+def compare_with_benchmark(results, baseline, args):
+    """
+    Median stage times and nodes/sec against a previous benchmark of the same graphs
+    """
+    regressions = []
+    for graph, stages in results["graphs"].items():
+        for stage, result in stages.items():
+            old = baseline["graphs"].get(graph, {}).get(stage)
+            if old is None:
+                continue
+            if is_slower(result["median"], old["median"], args):
+                regressions.append(
+                    f"{graph} {stage}: {old['median']:.4f} -> {result['median']:.4f} secs",
+                )
+            if "nodes_per_sec" not in result:
+                continue
+            if result["nodes_per_sec"] < old["nodes_per_sec"] * (1 - args.threshold):
+                regressions.append(
+                    f"{graph} {stage}: {old['nodes_per_sec']:.2f} -> "
+                    f"{result['nodes_per_sec']:.2f} nodes/sec",
+                )
+    return regressions
+
+
+def compare_with_outputs(results, outputs_dir, args):
+    """
+    Sum of the end-to-end stages against "Time (sec.)" and "Found Answer" of stored
+    main.py results. Graphs whose B&B didn't finish are only reported
+    """
+    regressions = []
+    for graph, stages in results["graphs"].items():
+        output_path = os.path.join(outputs_dir, f"{graph}.json")
+        if not os.path.exists(output_path):
+            continue
+        with open(output_path, "r") as fp:
+            output = json.load(fp)
+        if any(stage not in stages for stage in END_TO_END_STAGES):
+            logging.info(f"{graph}: not all of {END_TO_END_STAGES} were run, skipped")
+            continue
+        total_time = sum(stages[stage]["median"] for stage in END_TO_END_STAGES)
+        if not stages["bnb"]["finished"]:
+            logging.info(
+                f"{graph}: B&B reached the time limit after {total_time:.2f} secs, "
+                f"stored time: {output['Time (sec.)']:.2f} secs",
+            )
+            continue
+        if is_slower(total_time, output["Time (sec.)"], args):
+            regressions.append(
+                f"{graph}: {output['Time (sec.)']:.2f} -> {total_time:.2f} secs end-to-end",
+            )
+        if stages["bnb"]["clique_size"] < float(output["Found Answer"]):
+            regressions.append(
+                f"{graph}: found {stages['bnb']['clique_size']}, stored {output['Found Answer']}",
+            )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(
+        description="Times the solver stages on DIMACS graph lists and compares them with baselines",
+    )
+    parser.add_argument(
+        "inputs",
+        type=str,
+        nargs="+",
+        help="Graph lists (input/*.txt) or single .clq graphs",
+    )
+    parser.add_argument(
+        "-s",
+        "--stages",
+        type=str,
+        nargs="+",
+        choices=list(STAGES),
+        default=None,
+        help="Stages to run (all available ones by default)",
+    )
+    parser.add_argument(
+        "--cplex_free",
+        action="store_true",
+        help="Run only the stages which don't need CPLEX",
+    )
+    parser.add_argument(
+        "-r", "--repeats", type=int, default=3, help="Runs of every stage",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the randomized stages",
+    )
+    parser.add_argument(
+        "-t",
+        "--time_limit",
+        type=int,
+        default=60,
+        help="Time limit of the B&B stages (in secs)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="Results JSON (benchmarks/<timestamp>.json by default)",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Previous benchmark JSONs or main.py output directories (e.g. outputs/easy)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown which is reported as a regression",
+    )
+    parser.add_argument(
+        "--min_difference",
+        type=float,
+        default=0.01,
+        help="Slowdowns smaller than this (in secs) are considered noise",
+    )
+    return parser.parse_args(argv)
+
+
+def read_graph_paths(inputs):
+    paths = []
+    for path in inputs:
+        if path.endswith(".txt"):
+            with open(path, "r") as fp:
+                paths.extend(line.rstrip().split(",")[0] for line in fp.readlines()[1:])
+        else:
+            paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    cplex_available = CliqueSolver is not None
+    stages = args.stages or list(STAGES)
+    if args.cplex_free or not cplex_available:
+        if not cplex_available:
+            logging.warning("CPLEX isn't available, running the CPLEX-free stages only")
+        stages = [stage for stage in stages if not STAGES[stage][1]]
+    # Every stage gets its graph from read_graph
+    stages = sorted(set(stages) | {"read_graph"}, key=list(STAGES).index)
+    results = {
+        "date": datetime.now().isoformat(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "cplex": cplex_available,
+        "seed": args.seed,
+        "repeats": args.repeats,
+        "time_limit": args.time_limit,
+        "stages": stages,
+        "graphs": {},
+    }
+    for path in read_graph_paths(args.inputs):
+        results["graphs"][os.path.basename(path)] = benchmark_graph(path, stages, args)
+
+    output_path = args.output or os.path.join(
+        "benchmarks", f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json",
+    )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as fp:
+        json.dump(results, fp, indent=4)
+    logging.info(f"Benchmark results are written to {output_path}")
+
+    regressions = []
+    for baseline in args.baseline:
+        if os.path.isdir(baseline):
+            regressions.extend(compare_with_outputs(results, baseline, args))
+        else:
+            with open(baseline, "r") as fp:
+                regressions.extend(compare_with_benchmark(results, json.load(fp), args))
+    for regression in regressions:
+        logging.warning(f"Slowdown: {regression}")
+    if args.baseline and not regressions:
+        logging.info("No slowdowns against the baselines")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
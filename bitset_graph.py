@@ -0,0 +1,310 @@
+import hashlib
+
+import networkx as nx
+import numpy as np
+
+WORD_SIZE = 64
+
+if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+
+    def popcount(words):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+
+else:
+    _BYTE_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], np.uint8)
+
+    def popcount(words):
+        words = np.ascontiguousarray(words)
+        bytes_view = words.view(np.uint8).reshape(*words.shape[:-1], -1)
+        return _BYTE_POPCOUNT[bytes_view].sum(axis=-1, dtype=np.int64)
+
+
+def pack_bits(bool_array, words_number):
+    """
+    Packs the last axis of a boolean array into uint64 words: vertex v is the bit
+    v % 64 of the word v // 64
+    """
+    bool_array = np.asarray(bool_array, dtype=bool)
+    packed = np.packbits(bool_array, axis=-1, bitorder="little")
+    padding = words_number * 8 - packed.shape[-1]
+    if padding:
+        pad_width = [(0, 0)] * (packed.ndim - 1) + [(0, padding)]
+        packed = np.pad(packed, pad_width)
+    return np.ascontiguousarray(packed).view("<u8")
+
+
+def unpack_bits(words, num_nodes):
+    words = np.ascontiguousarray(words)
+    bytes_view = words.view(np.uint8)
+    return np.unpackbits(bytes_view, axis=-1, bitorder="little")[..., :num_nodes].astype(
+        bool,
+    )
+
+
+def greedy_coloring_bound(int_rows, candidates, limit):
+    """
+    Number of color classes of the sequential greedy coloring of the candidates
+    (a python int bitset), stops as soon as it exceeds the limit
+    """
+    colors = 0
+    uncolored = candidates
+    while uncolored:
+        colors += 1
+        if colors > limit:
+            break
+        available = uncolored
+        while available:
+            lowest = available & -available
+            uncolored ^= lowest
+            available &= ~(int_rows[lowest.bit_length() - 1] | lowest)
+    return colors
+
+
+class IncrementalCliqueChecker:
+    """
+    Clique checks along a DFS path: every vertex fixed to 1 is verified against the
+    ones fixed above it when it's pushed, so a leaf only checks its other vertices.
+    Common neighbors of the fixed vertices are kept as well, for the coloring bound
+    """
+
+    def __init__(self, graph):
+        self.int_rows = graph.int_rows()
+        # (bitset of the vertices fixed to 1, first non-adjacent pair among them,
+        # bitset of their common neighbors)
+        self.path = [(0, None, (1 << graph.number_of_nodes()) - 1)]
+
+    def push(self, vertex):
+        clique, violation, common_neighbors = self.path[-1]
+        if violation is None:
+            violation = self.find_missing_edge(clique, vertex)
+        self.path.append(
+            (clique | 1 << vertex, violation, common_neighbors & self.int_rows[vertex]),
+        )
+
+    def pop(self):
+        self.path.pop()
+
+    def find_missing_edge(self, clique, vertex):
+        missing = clique & ~self.int_rows[vertex]
+        if not missing:
+            return None
+        return (missing & -missing).bit_length() - 1, vertex
+
+    def check(self, nodes):
+        """
+        Pair of non-adjacent vertices among the path ones and the given ones, None if
+        they form a clique
+        """
+        clique, violation = self.path[-1][:2]
+        if violation is not None:
+            return violation
+        for vertex in nodes:
+            if clique >> vertex & 1:
+                continue
+            violation = self.find_missing_edge(clique, vertex)
+            if violation is not None:
+                return violation
+            clique |= 1 << vertex
+        return None
+
+
+class BitsetGraph:
+    """
+    Undirected graph without self-loops stored as packed adjacency rows
+    (num_nodes x ceil(num_nodes / 64) uint64 words)
+    """
+
+    def __init__(self, rows, num_nodes):
+        self.rows = rows
+        self.num_nodes = num_nodes
+        self.words_number = rows.shape[1]
+        self._networkx = None
+        self._int_rows = None
+
+    @classmethod
+    def from_dense(cls, adjacency_matrix):
+        adjacency_matrix = np.asarray(adjacency_matrix, dtype=bool)
+        adjacency_matrix = adjacency_matrix | adjacency_matrix.T
+        np.fill_diagonal(adjacency_matrix, False)
+        num_nodes = adjacency_matrix.shape[0]
+        words_number = max(1, -(-num_nodes // WORD_SIZE))
+        return cls(pack_bits(adjacency_matrix, words_number), num_nodes)
+
+    @classmethod
+    def from_edges(cls, num_nodes, edges):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        adjacency_matrix = np.zeros((num_nodes, num_nodes), dtype=bool)
+        adjacency_matrix[edges[:, 0], edges[:, 1]] = True
+        return cls.from_dense(adjacency_matrix)
+
+    @classmethod
+    def from_networkx(cls, graph):
+        nodes = {node: idx for idx, node in enumerate(graph.nodes)}
+        edges = [(nodes[first], nodes[second]) for first, second in graph.edges]
+        return cls.from_edges(len(nodes), edges)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_networkx"] = None  # Rebuilt on demand
+        state["_int_rows"] = None
+        return state
+
+    def number_of_nodes(self):
+        return self.num_nodes
+
+    def number_of_edges(self):
+        return int(self.degrees().sum()) // 2
+
+    def degrees(self):
+        return popcount(self.rows)
+
+    def int_rows(self):
+        """
+        Rows as python ints: single bit operations on them are much cheaper than numpy
+        calls, which matters in per-vertex loops
+        """
+        if self._int_rows is None:
+            self._int_rows = [
+                int.from_bytes(row.tobytes(), "little") for row in self.rows.astype("<u8")
+            ]
+        return self._int_rows
+
+    def content_hash(self):
+        """
+        Hash of the adjacency, used as a key of on-disk caches
+        """
+        digest = hashlib.sha1(np.int64(self.num_nodes).tobytes())
+        digest.update(np.ascontiguousarray(self.rows).tobytes())
+        return digest.hexdigest()[:16]
+
+    def to_dense(self):
+        return unpack_bits(self.rows, self.num_nodes)
+
+    def to_mask(self, nodes):
+        """
+        Packs a vertex set (indices or a boolean vector) into a bitset
+        """
+        nodes = np.asarray(nodes)
+        if nodes.dtype != bool:
+            indices = nodes.astype(np.int64)
+            nodes = np.zeros(self.num_nodes, dtype=bool)
+            nodes[indices] = True
+        return pack_bits(nodes, self.words_number)
+
+    def from_mask(self, mask):
+        return np.flatnonzero(unpack_bits(mask, self.num_nodes))
+
+    def neighbors(self, node):
+        return self.from_mask(self.rows[node])
+
+    def adjacency_row(self, node):
+        return unpack_bits(self.rows[node], self.num_nodes)
+
+    def common_neighbors(self, nodes):
+        """
+        Bitset of vertices adjacent to all given ones
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if not len(nodes):
+            return self.to_mask(np.ones(self.num_nodes, dtype=bool))
+        return np.bitwise_and.reduce(self.rows[nodes], axis=0)
+
+    def count_in(self, mask, nodes=None):
+        """
+        Number of neighbors of every (given) vertex inside the bitset
+        """
+        rows = self.rows if nodes is None else self.rows[np.asarray(nodes, np.int64)]
+        return popcount(rows & mask)
+
+    def is_clique(self, nodes):
+        return self.find_missing_edge(nodes) is None
+
+    def find_missing_edge(self, nodes):
+        """
+        Pair of non-adjacent vertices among the given ones, None if they form a clique
+        """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        if len(nodes) < 2:
+            return None
+        mask = self.to_mask(nodes)
+        violating = np.flatnonzero(self.count_in(mask, nodes) != len(nodes) - 1)
+        if not len(violating):
+            return None
+        first = nodes[violating[0]]
+        missing = self.from_mask(mask & ~self.rows[first])
+        return int(first), int(missing[missing != first][0])
+
+    def degeneracy_order(self):
+        """
+        Repeatedly removes a vertex of the smallest remaining degree, O(n + m) with a
+        bucket queue (Batagelj & Zaversnik). Returns the removal order and core numbers
+        """
+        degrees = self.degrees().tolist()
+        neighbors = [np.flatnonzero(row).tolist() for row in self.to_dense()]
+        max_degree = max(degrees, default=0)
+        # bucket_start[d] is the position of the first vertex of degree d in the order
+        bucket_start = [0] * (max_degree + 2)
+        for degree in degrees:
+            bucket_start[degree + 1] += 1
+        for degree in range(1, max_degree + 2):
+            bucket_start[degree] += bucket_start[degree - 1]
+        order = [0] * self.num_nodes
+        position = [0] * self.num_nodes
+        next_free = bucket_start[:]
+        for node, degree in enumerate(degrees):
+            position[node] = next_free[degree]
+            order[position[node]] = node
+            next_free[degree] += 1
+        for current_position in range(self.num_nodes):
+            # Swaps below only touch positions after the current one
+            node = order[current_position]
+            node_degree = degrees[node]
+            for neighbor in neighbors[node]:
+                degree = degrees[neighbor]
+                if degree > node_degree:
+                    # Swap the neighbor with the first vertex of its bucket and shift
+                    # the bucket boundary, so the neighbor falls into bucket degree - 1
+                    first_position = bucket_start[degree]
+                    first_node = order[first_position]
+                    if first_node != neighbor:
+                        neighbor_position = position[neighbor]
+                        order[neighbor_position] = first_node
+                        position[first_node] = neighbor_position
+                        order[first_position] = neighbor
+                        position[neighbor] = first_position
+                    bucket_start[degree] += 1
+                    degrees[neighbor] = degree - 1
+        return np.array(order, dtype=np.int64), np.array(degrees, dtype=np.int64)
+
+    def complement(self):
+        rows = ~self.rows
+        rows &= self.to_mask(np.ones(self.num_nodes, dtype=bool))  # Padding bits
+        nodes = np.arange(self.num_nodes)
+        rows[nodes, nodes // WORD_SIZE] &= ~(
+            np.uint64(1) << (nodes % WORD_SIZE).astype(np.uint64)
+        )
+        return BitsetGraph(rows, self.num_nodes)
+
+    def subgraph(self, nodes):
+        """
+        Induced subgraph, vertices are relabelled to 0..len(nodes) - 1 in the given order
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return BitsetGraph.from_dense(self.to_dense()[np.ix_(nodes, nodes)])
+
+    @property
+    def edges(self):
+        first, second = np.nonzero(np.triu(self.to_dense(), 1))
+        return np.stack([first, second], axis=1)
+
+    def to_networkx(self):
+        """
+        Adapter for networkx-based code, the graph is built once and cached
+        """
+        if self._networkx is None:
+            graph = nx.Graph()
+            graph.add_nodes_from(range(self.num_nodes))
+            graph.add_edges_from(self.edges.tolist())
+            self._networkx = graph
+        return self._networkx
@@ -1,147 +1,202 @@
 import logging
-from collections import defaultdict
+from collections import namedtuple
 from math import floor
-from time import time
+from time import perf_counter, time
 
 import cplex
-import networkx as nx
 import numpy as np
 
-from utils import cartesian_product, check_clique, time_it
+from bitset_graph import IncrementalCliqueChecker, greedy_coloring_bound
+from branching import BRANCHING_POLICIES
+from heuristic import LPRoundingHeuristic
+from independent_sets import IndependentSetGenerator
+from node_queue import OpenNodeQueue
+from reduction import log_reduction, peel_vertices
+from separation import IndependentSetSeparator
+from tracing import traced
+from utils import (
+    SearchResultsMixin,
+    complement_pair_keys,
+    get_clique_nodes,
+    get_peak_memory_mb,
+    independent_sets_pair_keys,
+    time_it,
+)
+
+# Solution statuses of the node LPs (and of the MIP in ILP mode) which prune the node
+INFEASIBLE_STATUSES = [
+    "infeasible",
+    "infeasible_or_unbounded",
+    "MIP_infeasible",
+    "MIP_infeasible_or_unbounded",
+]
+
+# Open node of the iterative search: LP bound of the parent, variables fixed on the path
+# from the root and the (compressed) parent basis, used to warm start the dual simplex
+Node = namedtuple(
+    "Node", ["bound", "depth", "fixed_variables", "fixed_values", "basis"],
+)
 
 
 class CliqueSolver:
-    def __init__(self, graph, solve_type, time_limit, debug=False):
+    def __init__(
+        self,
+        graph,
+        solve_type,
+        time_limit,
+        debug=False,
+        lazy_constraints=False,
+        independent_sets_cache=None,
+        independent_sets=None,
+        seed=None,
+        problem=None,
+    ):
         assert solve_type in ["LP", "ILP"], "Solve type should be either LP or ILP"
         self.graph = graph
         self.solve_type = solve_type
         self.debug = debug
-        self.n_independent_sets_growth_ratio = 0.02
+        # Only independent set rows are built, the rest is separated on demand
+        self.lazy_constraints = lazy_constraints
+        self.independent_sets_cache = independent_sets_cache
+        # Independent sets of a resumed search are taken from its checkpoint
+        self.independent_sets = independent_sets
+        self.seed = seed
+        self.constraints_chunk_size = 50000
         self.timer = time()
         self.time_limit = time_limit
-        self.problem = self.construct_problem()[0]  # time_it returns time additionally
+        # A tracer can only be attached after the construction, which is timed here
+        self.tracer = None
+        self.phase_times = {}
+        if problem is None:
+            self.problem, construct_time = self.construct_problem()
+            # Phases don't overlap, the independent sets are timed on their own
+            self.phase_times["construct_problem"] = (
+                construct_time / 1000 - self.phase_times["independent_sets"]
+            )
+        else:
+            # A copy of a cached root model, its rows are these independent sets
+            assert (
+                independent_sets is not None
+            ), "Independent sets of the given problem are required"
+            self.problem = problem
+            self.set_parameters(problem)
 
-    @time_it
-    def construct_problem(self):
-        problem = cplex.Cplex()
+    def set_parameters(self, problem):
         if not self.debug:
             problem.set_log_stream(None)
             problem.set_results_stream(None)
             problem.set_warning_stream(None)
             problem.set_error_stream(None)
+        if self.seed is not None:
+            problem.parameters.randomseed.set(self.seed)
+
+    @time_it
+    def construct_problem(self):
+        problem = cplex.Cplex()
+        self.set_parameters(problem)
 
         problem.objective.set_sense(problem.objective.sense.maximize)
-        if self.solve_type == "LP":
-            type_one = 1.0
-            type_zero = 0.0
-            var_type = problem.variables.type.continuous
-        else:
-            type_one = 1
-            type_zero = 0
-            var_type = problem.variables.type.binary
         num_nodes = self.graph.number_of_nodes()
-        obj = [type_one] * num_nodes
-        upper_bounds = [type_one] * num_nodes
-        lower_bounds = [type_zero] * num_nodes
-        types = zip(range(num_nodes), [var_type] * num_nodes)
-        columns_names = [f"x{x}" for x in range(num_nodes)]
-        not_connected = np.array(nx.complement(self.graph).edges)
-        independent_sets = self.get_independent_sets()
-
-        problem.variables.add(
-            obj=obj, ub=upper_bounds, lb=lower_bounds, names=columns_names,
-        )
-        problem.variables.set_types(types)
-
-        constraints = []
-        pairs_covered_by_independent_sets = list()
-        for ind_set in independent_sets:
-            constraints.append([[f"x{i}" for i in ind_set], [type_one] * len(ind_set)])
-            pairs_covered_by_independent_sets.extend(
-                cartesian_product(ind_set, ind_set),
+        columns = {
+            "obj": [1.0] * num_nodes,
+            "ub": [1.0] * num_nodes,
+            "lb": [0.0] * num_nodes,
+            "names": [f"x{x}" for x in range(num_nodes)],
+        }
+        problem.variables.add(**columns)
+
+        # Independent sets are evaluated by the LP, so types are set afterwards
+        start_time = time()
+        if self.independent_sets is None:
+            self.independent_sets = self.get_independent_sets(problem)
+        else:
+            self.add_independent_set_rows(problem, self.independent_sets)
+        self.phase_times["independent_sets"] = time() - start_time
+        independent_sets = self.independent_sets
+        # Setting types (even continuous) turns the problem into a MIP
+        if self.solve_type == "ILP":
+            problem.variables.set_types(
+                [(idx, problem.variables.type.binary) for idx in range(num_nodes)],
             )
-        if len(pairs_covered_by_independent_sets):
-            pairs_covered_by_independent_sets = np.asarray(
-                pairs_covered_by_independent_sets,
+        if self.lazy_constraints:
+            not_connected = np.empty(0, dtype=np.int64)
+        else:
+            covered_pairs = independent_sets_pair_keys(independent_sets, num_nodes)
+            # Both arrays are sorted and unique, so it's a linear merge after the sort
+            not_connected = np.setdiff1d(
+                complement_pair_keys(self.graph), covered_pairs, assume_unique=True,
             )
-            pairs_covered_by_independent_sets = np.unique(
-                pairs_covered_by_independent_sets, axis=0,
+            del covered_pairs
+        for chunk in self.iterate_constraints([], not_connected):
+            problem.linear_constraints.add(
+                lin_expr=chunk, senses="L" * len(chunk), rhs=[1.0] * len(chunk),
             )
-            condition = (
-                pairs_covered_by_independent_sets[:, 0]
-                == pairs_covered_by_independent_sets[:, 1]
+        logging.info(
+            f"Constructed the problem with {num_nodes} variables, {len(independent_sets)} independent set "
+            f"and {len(not_connected)} edge constraints, peak memory: {get_peak_memory_mb():.1f} MB",
+        )
+        return problem
+
+    def iterate_constraints(self, independent_sets, not_connected):
+        """
+        Yields constraints in chunks of constraints_chunk_size rows, so only one chunk
+        of python lists is alive at a time
+        """
+        chunk_size = self.constraints_chunk_size
+        for start in range(0, len(independent_sets), chunk_size):
+            yield [
+                cplex.SparsePair(ind=list(ind_set), val=[1.0] * len(ind_set))
+                for ind_set in independent_sets[start : start + chunk_size]
+            ]
+        num_nodes = self.graph.number_of_nodes()
+        for start in range(0, len(not_connected), chunk_size):
+            first, second = np.divmod(
+                not_connected[start : start + chunk_size], num_nodes,
             )
-            pairs_covered_by_independent_sets = np.delete(
-                pairs_covered_by_independent_sets, np.where(condition), axis=0,
+            yield [
+                cplex.SparsePair(ind=[xi, xj], val=[1.0, 1.0])
+                for xi, xj in zip(first.tolist(), second.tolist())
+            ]
+
+    def add_independent_set_rows(self, problem, independent_sets):
+        for chunk in self.iterate_constraints(
+            independent_sets, np.empty(0, dtype=np.int64),
+        ):
+            problem.linear_constraints.add(
+                lin_expr=chunk, senses="L" * len(chunk), rhs=[1.0] * len(chunk),
             )
-            # Below is from https://stackoverflow.com/questions/40055835/removing-elements-from-an-array-that-are-in-another-array
-            try:  # On very large arrays it can fail
-                not_connected = not_connected[
-                    ~(
-                        (
-                            not_connected[:, None, :]
-                            == pairs_covered_by_independent_sets
-                        ).all(-1)
-                    ).any(1)
-                ]  # Remove pairs covered by independent sets from not connected
-            except AttributeError:
-                logging.warning("Failed to remove pairs covered by independent sets")
-        for xi, xj in not_connected:
-            constraints.append([[f"x{xi}", f"x{xj}"], [type_one, type_one]])
-
-        contstraints_length = len(constraints)
-        right_hand_side = [type_one] * contstraints_length
-        constraint_names = [f"c{i}" for i in range(contstraints_length)]
-        constraint_senses = ["L"] * contstraints_length
-
-        problem.linear_constraints.add(
-            lin_expr=constraints,
-            senses=constraint_senses,
-            rhs=right_hand_side,
-            names=constraint_names,
+
+    def get_independent_sets(self, problem):
+        """
+        Generates independent set rows straight into the problem, its LP bound
+        decides when to stop
+        """
+
+        def get_bound():
+            problem.solve()
+            return problem.solution.get_objective_value()
+
+        generator = IndependentSetGenerator(
+            self.graph,
+            self.time_limit * 0.1,
+            cache=self.independent_sets_cache,
+            seed=self.seed,
+        )
+        return generator.generate(
+            lambda independent_sets: self.add_independent_set_rows(
+                problem, independent_sets,
+            ),
+            get_bound,
         )
-        return problem
 
-    def get_independent_sets(self):
-        independent_sets = set()
-        strategies = [
-            nx.coloring.strategy_largest_first,
-            nx.coloring.strategy_random_sequential,
-            nx.coloring.strategy_connected_sequential_bfs,
-            nx.coloring.strategy_connected_sequential_dfs,
-            nx.coloring.strategy_saturation_largest_first,
-            nx.coloring.strategy_smallest_last,
-        ]
-        if self.graph.number_of_nodes() < 500:
-            strategies.append(
-                nx.coloring.strategy_independent_set,
-            )  # This strategy is extremely slow on huge graphs
-        iterations_number = 0
-        while True:
-            if time() - self.timer >= self.time_limit * 0.1:
-                logging.info("Out of time for independent sets searching")
-                break
-            iterations_number += 1
-            independent_sets_number = len(independent_sets)
-            for strategy in strategies:
-                ind_sets_dict = defaultdict(list)
-                colors_dict = nx.coloring.greedy_color(self.graph, strategy=strategy)
-                for node, color in colors_dict.items():
-                    ind_sets_dict[color].append(node)
-                for _, ind_set in ind_sets_dict.items():
-                    if len(ind_set) > 2:
-                        independent_sets.add(tuple(sorted(ind_set)))
-            if (len(independent_sets) - independent_sets_number) / len(
-                independent_sets,
-            ) < self.n_independent_sets_growth_ratio:
-                logging.info(
-                    f"Searched for independent sets during {iterations_number} iterations",
-                )
-                break
-        return list(independent_sets)
+    def solve_problem(self):
+        start = perf_counter()
+        self.problem.solve()
+        if self.tracer is not None:
+            self.tracer.record_lp(perf_counter() - start)
 
     def solve(self):
-        self.problem.solve()
+        self.solve_problem()
         solution = self.problem.solution.get_values()
         objective_value = self.problem.solution.get_objective_value()
         return solution, objective_value
@@ -161,86 +216,715 @@ class CliqueSolver:
             raise TimeoutError
 
 
-class BnBCliqueSolver(CliqueSolver):
-    def __init__(self, graph, solve_type, time_limit, debug=False):
-        super().__init__(graph, solve_type, time_limit, debug)
+class BnBCliqueSolver(SearchResultsMixin, CliqueSolver):
+    def __init__(
+        self,
+        graph,
+        solve_type,
+        time_limit,
+        debug=False,
+        lazy_constraints=False,
+        coloring_bound=True,
+        independent_sets_cache=None,
+        independent_sets=None,
+        branching="closest_to_one",
+        rounding_frequency=100,
+        seed=None,
+        problem=None,
+    ):
+        super().__init__(
+            graph,
+            solve_type,
+            time_limit,
+            debug,
+            lazy_constraints,
+            independent_sets_cache,
+            independent_sets,
+            seed=seed,
+            problem=problem,
+        )
         self.best_found_clique_size = 0
-        self.best_solution = None
+        # Vertex ids of the incumbent, dense solutions are built on request
+        self.best_clique = None
         self.branch_idx = 0
         self.epsilon = 1e-3
         self.branching_set = set()
         self.added_constraints_size = 0
         self.call_times = 0
-        self.contrained_variables = np.zeros(self.graph.number_of_nodes())
+        # Values of the branching rows on the current path, -1 for free variables
+        self.contrained_variables = np.full(
+            self.graph.number_of_nodes(), -1, dtype=np.int8,
+        )
+        # (variable, value, parent LP bound) of the branches on the current path
+        self.branch_path = []
+        # Node LP values, the fractional mask and the branching scores are written into
+        # these buffers instead of new arrays. Values are overwritten by the next LP
+        # solve
+        num_nodes = self.graph.number_of_nodes()
+        self.lp_values = np.zeros(num_nodes)
+        self.lp_workspace = np.zeros(num_nodes)
+        self.fractional = np.zeros(num_nodes, dtype=bool)
+        self.clique_checker = IncrementalCliqueChecker(self.graph)
+        # Vertices fixed to 0 on the path of the recursive engine
+        self.zeros_bitset = 0
+        self.use_coloring_bound = coloring_bound
+        assert (
+            branching in BRANCHING_POLICIES
+        ), f"Branching should be one of {list(BRANCHING_POLICIES)}"
+        self.branching_policy = BRANCHING_POLICIES[branching]()
+        self.strong_branching_lp_calls = 0
+        # LP rounding heuristic runs every rounding_frequency nodes, 0 disables it
+        self.rounding_frequency = rounding_frequency
+        self.rounding_heuristic = None
+        self.rounding_improvements = 0
+        self.best_found_time = None
+        self.lp_calls_avoided = 0
+        self.pruned_columns_bitset = 0
+        self.search_timer = None
+        self.root_bound = None
+        self.search_finished = False
+        self.checkpointer = None
+        self.reduce_on_improvement = True
+        self.pruned_columns = np.zeros(self.graph.number_of_nodes(), dtype=bool)
+        self.separator = (
+            IndependentSetSeparator(self.graph, self.epsilon) if lazy_constraints else None
+        )
+        self.max_separation_rounds = 20
+        self.max_cut_age = 100  # Number of LP solves a cut may stay slack
+        self.cut_names = []
+        self.cut_ages = np.empty(0, dtype=np.int64)
+        self.cuts_number = 0
 
+    @traced("constraint_edit")
     def add_constraint(self, variable, rhs, branch_idx):
         self.problem.linear_constraints.add(
-            lin_expr=[[[f"x{variable}"], [1.0]]],
+            lin_expr=[[[int(variable)], [1.0]]],
             senses=["E"],
             rhs=[rhs],
             names=[f"branch_{branch_idx}"],
         )
 
+    @traced("constraint_edit")
     def delete_constraint(self, branch_idx):
         self.problem.linear_constraints.delete(f"branch_{branch_idx}")
 
-    # We take the variable which is the closest to 1 as branching variable
-    def find_branching_variable(self, solution):
-        equals_one = np.isclose(solution, 1.0, atol=self.epsilon)
-        equals_zero = np.isclose(solution, 0.0, atol=self.epsilon)
-        integer_var = equals_zero | equals_one
-        if np.all(integer_var):
+    def solve_lp(self):
+        """
+        Node LP, its values are copied into the preallocated buffer. Returns
+        (None, None) for an infeasible LP, cplex doesn't raise for it and its values
+        violate the bounds. Any other failure is raised, the node can't be pruned
+        """
+        self.solve_problem()
+        solution = self.problem.solution
+        if not solution.is_primal_feasible():
+            status = solution.get_status()
+            if any(status == getattr(solution.status, name) for name in INFEASIBLE_STATUSES):
+                return None, None
+            raise RuntimeError(
+                f"Node LP wasn't solved: {solution.get_status_string()}",
+            )
+        self.lp_values[:] = self.problem.solution.get_values()
+        return self.lp_values, self.problem.solution.get_objective_value()
+
+    def get_fractional(self, solution):
+        """
+        Values farther than epsilon from both 0 and 1, i.e. |x - 0.5| < 0.5 - epsilon,
+        computed in place in the workspace (the mask is reused by the next call)
+        """
+        np.subtract(solution, 0.5, out=self.lp_workspace)
+        np.abs(self.lp_workspace, out=self.lp_workspace)
+        return np.less(self.lp_workspace, 0.5 - self.epsilon, out=self.fractional)
+
+    def find_branching_variable(self, solution, depth=0):
+        fractional = self.get_fractional(solution)
+        if not np.any(fractional):
             return None
-        else:
-            return np.argmax(
-                np.where(~equals_one, solution, -1),
-            )  # Variables equal to 1 are set to -1 (we don't want to take them)
+        return self.branching_policy.select(self, solution, fractional, depth)
+
+    def update_branching_policy(self, objective_value):
+        """
+        Reports the LP bound drop of the last branch on the current path
+        """
+        if self.branch_path:
+            variable, value, parent_bound = self.branch_path[-1]
+            self.branching_policy.update(
+                variable, value, parent_bound - objective_value,
+            )
+
+    @traced("coloring_bound")
+    def prune_by_coloring(self, ones, zeros):
+        """
+        Cheap bound before the LP: number of vertices fixed to 1 plus the number of
+        colors of a greedy coloring of the free vertices adjacent to all of them
+        """
+        if not self.use_coloring_bound or self.best_found_clique_size < 1:
+            return False
+        int_rows = self.graph.int_rows()
+        ones_bitset = 0
+        candidates = (1 << self.graph.number_of_nodes()) - 1
+        for variable in ones.tolist():
+            if ones_bitset & ~int_rows[variable]:
+                return True  # Vertices fixed to 1 don't form a clique
+            ones_bitset |= 1 << variable
+            candidates &= int_rows[variable]
+        for variable in zeros.tolist():
+            candidates &= ~(1 << variable)
+        return self.prune_candidates(candidates, len(ones))
+
+    @traced("coloring_bound")
+    def prune_path_by_coloring(self):
+        """
+        Coloring bound of the recursive engine, the vertices fixed to 1 and their
+        common neighbors are kept by the clique checker along the path
+        """
+        if not self.use_coloring_bound or self.best_found_clique_size < 1:
+            return False
+        clique, violation, common_neighbors = self.clique_checker.path[-1]
+        if violation is not None:
+            return True  # Vertices fixed to 1 don't form a clique
+        return self.prune_candidates(
+            common_neighbors & ~self.zeros_bitset, len(self.clique_checker.path) - 1,
+        )
+
+    def prune_candidates(self, candidates, ones_number):
+        candidates &= ~self.pruned_columns_bitset
+        limit = floor(self.best_found_clique_size + self.epsilon) - ones_number
+        if bin(candidates).count("1") <= limit:
+            return True
+        return greedy_coloring_bound(self.graph.int_rows(), candidates, limit) <= limit
+
+    @traced("constraint_edit")
+    def add_cuts(self, cuts):
+        names = [f"cut_{self.cuts_number + idx}" for idx in range(len(cuts))]
+        self.cuts_number += len(cuts)
+        self.problem.linear_constraints.add(
+            lin_expr=[cplex.SparsePair(ind=cut, val=[1.0] * len(cut)) for cut in cuts],
+            senses="L" * len(cuts),
+            rhs=[1.0] * len(cuts),
+            names=names,
+        )
+        self.cut_names.extend(names)
+        self.cut_ages = np.concatenate(
+            [self.cut_ages, np.zeros(len(cuts), dtype=np.int64)],
+        )
+
+    @traced("constraint_edit")
+    def age_cuts(self):
+        """
+        Removes cuts which were slack in the last max_cut_age LP solutions
+        """
+        if not self.cut_names:
+            return
+        slacks = np.asarray(self.problem.solution.get_linear_slacks(self.cut_names))
+        self.cut_ages = np.where(slacks > self.epsilon, self.cut_ages + 1, 0)
+        expired = self.cut_ages > self.max_cut_age
+        if not expired.any():
+            return
+        self.problem.linear_constraints.delete(
+            [name for name, old in zip(self.cut_names, expired) if old],
+        )
+        self.cut_names = [name for name, old in zip(self.cut_names, expired) if not old]
+        self.cut_ages = self.cut_ages[~expired]
+
+    @traced("separation")
+    def separate(self, solution):
+        return self.separator.separate(solution)
+
+    @traced("check_clique")
+    def is_clique(self, solution):
+        """
+        Integral LP solutions are checked against the vertices fixed to 1 on the
+        current path only, which were verified when they were fixed
+        """
+        violation = self.clique_checker.check(get_clique_nodes(solution).tolist())
+        if violation is not None:
+            logging.debug(
+                f"Integral LP solution isn't a clique: {violation[0]} and {violation[1]} aren't adjacent",
+            )
+        return violation is None
+
+    def trace_node(self, depth, bound, reason):
+        if self.tracer is not None:
+            self.tracer.record_node(depth, bound, reason, self.get_node_memory)
+
+    def solve_relaxation(self):
+        """
+        Solves the node LP. In lazy mode violated independent set inequalities are
+        separated and the LP is re-solved until none is found (fractional solutions
+        are given up to max_separation_rounds rounds)
+        """
+        solution, objective_value = self.solve_lp()
+        if self.separator is None or solution is None:
+            return solution, objective_value
+        separation_rounds = 0
+        while floor(objective_value + self.epsilon) > self.best_found_clique_size:
+            self.age_cuts()
+            if (
+                separation_rounds >= self.max_separation_rounds
+                and np.any(self.get_fractional(solution))
+            ):
+                break
+            cuts = self.separate(solution)
+            if not cuts:
+                break
+            self.add_cuts(cuts)
+            separation_rounds += 1
+            solution, objective_value = self.solve_lp()
+            if solution is None:
+                break
+        return solution, objective_value
 
     def solve(self):
+        if self.clique_checker.path[-1][0] & self.pruned_columns_bitset:
+            # A vertex fixed to 1 on the path was reduced after it was branched on,
+            # its branch row contradicts the column bound
+            self.trace_node(len(self.branch_path), None, "reduced")
+            return 0
         self.call_times += 1
         self.check_time()
-        try:
-            solution, objective_value = super().solve()
-        except cplex.exceptions.CplexSolverError:
+        self.maybe_checkpoint()
+        if self.prune_path_by_coloring():
+            self.lp_calls_avoided += 1
+            self.trace_node(len(self.branch_path), None, "coloring")
+            return 0
+        solution, objective_value = self.solve_relaxation()
+        if solution is None:
+            self.trace_node(len(self.branch_path), None, "infeasible")
             return 0
+        if self.root_bound is None:
+            self.root_bound = objective_value
+        self.update_branching_policy(objective_value)
+        self.run_rounding_heuristic(solution)
         if floor(objective_value + self.epsilon) <= self.best_found_clique_size:
+            self.trace_node(len(self.branch_path), objective_value, "bound")
             return 0
 
         if self.call_times % 2500 == 0:
-            logging.info(
-                f"Total Call times: {self.call_times}, Best Found Solution: {self.best_found_clique_size},"
-                f"Current Solution: {objective_value}",
-            )
-            logging.info(
-                f"Number of constrained variables: {self.added_constraints_size}",
-            )
+            self.log_progress(objective_value)
 
-        branching_variable = self.find_branching_variable(solution)
+        branching_variable = self.find_branching_variable(
+            solution, len(self.branch_path),
+        )
 
         if branching_variable is None:
-            if not check_clique(self.graph, solution)[0]:
+            self.trace_node(len(self.branch_path), objective_value, "integral")
+            if not self.is_clique(solution):
                 return 0
-            self.best_found_clique_size = objective_value
-            self.best_solution = solution
+            self.update_incumbent(objective_value, solution)
         else:
+            self.trace_node(len(self.branch_path), objective_value, "branched")
             for branch_value in [1.0, 0.0]:
                 self.branch_idx += 1
                 current_branch = self.branch_idx
                 self.added_constraints_size += 1
                 self.add_constraint(branching_variable, branch_value, current_branch)
+                self.contrained_variables[branching_variable] = branch_value
+                self.branch_path.append(
+                    (branching_variable, branch_value, objective_value),
+                )
+                if branch_value == 1:
+                    self.clique_checker.push(branching_variable)
+                else:
+                    self.zeros_bitset |= 1 << branching_variable
                 self.solve()
+                if branch_value == 1:
+                    self.clique_checker.pop()
+                else:
+                    self.zeros_bitset &= ~(1 << branching_variable)
+                self.branch_path.pop()
+                self.contrained_variables[branching_variable] = -1
                 self.delete_constraint(current_branch)
                 self.added_constraints_size -= 1
         return 0
 
-    def get_solution(self):
-        return self.best_solution
-
-    def get_objective_value(self):
-        return self.best_found_clique_size
+    @traced("rounding_heuristic")
+    def run_rounding_heuristic(self, solution):
+        if not self.rounding_frequency or self.call_times % self.rounding_frequency:
+            return
+        if self.rounding_heuristic is None:
+            self.rounding_heuristic = LPRoundingHeuristic(self.graph, seed=self.seed)
+        clique_solution, clique_size = self.rounding_heuristic(solution)
+        if clique_size > self.best_found_clique_size:
+            logging.info(
+                f"LP rounding improved the incumbent: {self.best_found_clique_size} -> {clique_size}",
+            )
+            self.rounding_improvements += 1
+            self.update_incumbent(clique_size, clique_solution)
 
-    def set_objective_value(self, objective_value):
+    def update_incumbent(self, objective_value, solution):
         self.best_found_clique_size = objective_value
+        self.set_solution(solution)
+        self.best_found_time = time()
+        if self.tracer is not None:
+            self.tracer.record_incumbent(objective_value)
+        self.reduce_columns()
+
+    @traced("reduction")
+    def reduce_columns(self):
+        """
+        Fixes to zero columns of vertices which can't be in a clique larger than
+        the incumbent (degree + 1 <= incumbent after peeling)
+        """
+        if not self.reduce_on_improvement:
+            return
+        lower_bound = floor(self.best_found_clique_size + self.epsilon)
+        alive = peel_vertices(self.graph, lower_bound, ~self.pruned_columns)
+        newly_pruned = np.flatnonzero(~alive & ~self.pruned_columns)
+        if not len(newly_pruned):
+            return
+        log_reduction(self.graph, ~self.pruned_columns, alive, lower_bound)
+        self.pruned_columns = ~alive
+        for variable in newly_pruned.tolist():
+            self.pruned_columns_bitset |= 1 << variable
+        self.problem.variables.set_upper_bounds(
+            [(variable, 0.0) for variable in newly_pruned.tolist()],
+        )
+
+    @time_it
+    def __call__(self):
+        self.search_timer = time()
+        try:
+            result = self.solve()
+            self.search_finished = True
+            return result
+        finally:
+            self.log_search_statistics()
+            if self.checkpointer is not None:
+                if self.search_finished:
+                    self.checkpointer.remove()
+                else:
+                    self.checkpointer.save(self)
+
+    def log_progress(self, objective_value):
+        logging.info(
+            f"Total Call times: {self.call_times}, Best Found Solution: {self.best_found_clique_size},"
+            f"Current Solution: {objective_value}",
+        )
+        logging.info(
+            f"Number of constrained variables: {self.added_constraints_size}, "
+            f"Nodes/sec: {self.get_nodes_per_second():.2f}, Active cuts: {len(self.cut_names)}, "
+            f"LP calls avoided by coloring bound: {self.lp_calls_avoided}",
+        )
+
+    def get_search_statistics(self):
+        return {
+            "Branching": self.branching_policy.name,
+            "Nodes": self.call_times,
+            "Time To Best (sec.)": self.get_time_to_best(),
+        }
+
+    def log_search_statistics(self):
+        logging.info(
+            f"Explored {self.call_times} nodes, {self.get_nodes_per_second():.2f} nodes/sec, "
+            f"{self.lp_calls_avoided} LP calls avoided by coloring bound",
+        )
+        logging.info(
+            f"Branching: {self.branching_policy.name}, strong branching LP calls: "
+            f"{self.strong_branching_lp_calls}, time to best solution: {self.get_time_to_best()}, "
+            f"incumbent improvements by LP rounding: {self.rounding_improvements}",
+        )
+        logging.info(f"Best bound: {self.get_best_bound()}, gap: {self.get_gap()}")
+
+    @traced("checkpoint")
+    def maybe_checkpoint(self):
+        if self.checkpointer is not None and self.checkpointer.due():
+            self.checkpointer.save(self)
+
+    def get_open_nodes(self):
+        """
+        Open nodes of the recursive search: the current node and the "0" siblings of
+        the "1" branches on the path to it
+        """
+        variables = np.array(
+            [variable for variable, _, _ in self.branch_path], dtype=np.int32,
+        )
+        values = np.array([value for _, value, _ in self.branch_path], dtype=np.int8)
+        bounds = [bound for _, _, bound in self.branch_path]
+        nodes = [
+            Node(
+                bound=bounds[-1] if bounds else float(self.graph.number_of_nodes()),
+                depth=len(variables),
+                fixed_variables=variables,
+                fixed_values=values,
+                basis=None,
+            ),
+        ]
+        for depth in np.flatnonzero(values == 1).tolist():
+            nodes.append(
+                Node(
+                    bound=bounds[depth],
+                    depth=depth + 1,
+                    fixed_variables=variables[: depth + 1].copy(),
+                    fixed_values=np.append(values[:depth], np.int8(0)),
+                    basis=None,
+                ),
+            )
+        return nodes
+
+    def get_open_nodes_bound(self):
+        # Recursive search doesn't keep open nodes, the root relaxation is the only bound
+        return self.root_bound
+
+    def get_solution(self):
+        if self.best_clique is None:
+            return None
+        solution = np.zeros(self.graph.number_of_nodes())
+        solution[self.best_clique] = 1.0
+        return solution
 
     def set_solution(self, solution):
-        self.best_solution = solution
+        self.best_clique = (
+            None if solution is None else get_clique_nodes(solution).astype(np.int32)
+        )
+
+    def get_node_memory(self):
+        """
+        Bytes of the search state arrays: LP buffers, fixings and the incumbent
+        """
+        memory = (
+            self.lp_values.nbytes
+            + self.lp_workspace.nbytes
+            + self.fractional.nbytes
+            + self.contrained_variables.nbytes
+        )
+        if self.best_clique is not None:
+            memory += self.best_clique.nbytes
+        return memory
+
+
+class IterativeBnBCliqueSolver(BnBCliqueSolver):
+    """
+    Depth-first BnB with an explicit node stack. Branching fixes variables through
+    column bounds (no rows are added), and each node is re-solved with the dual
+    simplex. cplex keeps its basis across bound changes, so a child solved right after
+    its parent starts from the parent basis anyway. With warm_start the "0" children,
+    which are solved after the subtree of their sibling, get a stored copy of it
+    """
+
+    def __init__(
+        self,
+        graph,
+        solve_type,
+        time_limit,
+        debug=False,
+        warm_start=False,
+        node_selection="dfs",
+        max_queue_memory_mb=1024,
+        lazy_constraints=False,
+        coloring_bound=True,
+        independent_sets_cache=None,
+        independent_sets=None,
+        branching="closest_to_one",
+        rounding_frequency=100,
+        seed=None,
+        problem=None,
+    ):
+        super().__init__(
+            graph,
+            solve_type,
+            time_limit,
+            debug,
+            lazy_constraints,
+            coloring_bound,
+            independent_sets_cache,
+            independent_sets,
+            branching,
+            rounding_frequency,
+            seed,
+            problem,
+        )
+        # Bases are only available for LP, ILP is solved by a single MIP call
+        self.warm_start = warm_start and self.solve_type == "LP"
+        self.fixed_variables = {}
+        self.open_nodes = OpenNodeQueue(node_selection, max_queue_memory_mb)
+        self.current_node = None
+        # Node whose LP cplex solved last, its basis is still loaded
+        self.last_solved_node = None
+        if self.solve_type == "LP":
+            self.problem.parameters.lpmethod.set(
+                self.problem.parameters.lpmethod.values.dual,
+            )
+
+    def root_node(self):
+        return Node(
+            bound=float(self.graph.number_of_nodes()),
+            depth=0,
+            fixed_variables=np.empty(0, dtype=np.int32),
+            fixed_values=np.empty(0, dtype=np.int8),
+            basis=None,
+        )
+
+    def child_node(self, node, bound, variable, value, basis):
+        return Node(
+            bound=bound,
+            depth=node.depth + 1,
+            fixed_variables=np.append(node.fixed_variables, np.int32(variable)),
+            fixed_values=np.append(node.fixed_values, np.int8(value)),
+            basis=basis,
+        )
+
+    @traced("constraint_edit")
+    def apply_fixings(self, node):
+        target = dict(
+            zip(node.fixed_variables.tolist(), node.fixed_values.tolist()),
+        )
+        # Only the difference with the previously solved node is sent to cplex
+        released = [
+            variable for variable in self.fixed_variables if variable not in target
+        ]
+        changed = [
+            (variable, float(value))
+            for variable, value in target.items()
+            if self.fixed_variables.get(variable) != value
+        ]
+        if released:
+            self.problem.variables.set_lower_bounds(
+                [(variable, 0.0) for variable in released],
+            )
+            self.problem.variables.set_upper_bounds(
+                [
+                    (variable, 0.0 if self.pruned_columns[variable] else 1.0)
+                    for variable in released
+                ],
+            )
+        if changed:
+            self.problem.variables.set_lower_bounds(changed)
+            self.problem.variables.set_upper_bounds(changed)
+        self.fixed_variables = target
+        self.added_constraints_size = len(target)
+
+    def is_child(self, node, parent):
+        return (
+            parent is not None
+            and node.depth == parent.depth + 1
+            and np.array_equal(node.fixed_variables[:-1], parent.fixed_variables)
+            and np.array_equal(node.fixed_values[:-1], parent.fixed_values)
+        )
+
+    def get_basis(self):
+        column_status, row_status = self.problem.solution.basis.get_basis()
+        return (
+            np.asarray(column_status, dtype=np.int8),
+            np.asarray(row_status, dtype=np.int8),
+        )
+
+    @traced("warm_start")
+    def set_basis(self, basis):
+        column_status, row_status = basis
+        if len(row_status) != self.problem.linear_constraints.get_num():
+            return  # Cuts were added or removed since the basis was stored
+        self.problem.start.set_start(
+            col_status=column_status.tolist(),
+            row_status=row_status.tolist(),
+            col_primal=[],
+            row_primal=[],
+            col_dual=[],
+            row_dual=[],
+        )
+
+    def get_open_nodes(self):
+        nodes = self.open_nodes.nodes()
+        if self.current_node is not None:  # Interrupted while processing the node
+            nodes.append(self.current_node)
+        return nodes
+
+    def get_node_memory(self):
+        return super().get_node_memory() + self.open_nodes.memory
+
+    def resume(self, checkpoint):
+        """
+        Continues the search of a checkpoint from its open nodes
+        """
+        if checkpoint["graph_hash"] != self.graph.content_hash():
+            raise ValueError("The checkpoint was written for another graph")
+        self.best_found_clique_size = checkpoint["best_found_clique_size"]
+        self.set_solution(checkpoint["best_solution"])
+        self.root_bound = checkpoint["root_bound"]
+        for node in checkpoint["nodes"]:
+            self.open_nodes.push(node)
+        self.reduce_columns()
+
+    def get_open_nodes_bound(self):
+        bounds = [self.open_nodes.best_bound()]
+        if self.current_node is not None:  # Interrupted while processing the node
+            bounds.append(self.current_node.bound)
+        bounds = [bound for bound in bounds if bound is not None]
+        return max(bounds) if bounds else None
+
+    def process_node(self, node):
+        """
+        Solves the node LP, updates the incumbent and returns the ("0", "1") children
+        or None if the node is pruned
+        """
+        if floor(node.bound + self.epsilon) <= self.best_found_clique_size:
+            self.trace_node(node.depth, node.bound, "bound")
+            return None
+        if np.any(self.pruned_columns[node.fixed_variables[node.fixed_values == 1]]):
+            # A vertex fixed to 1 was reduced after the node was created
+            self.trace_node(node.depth, node.bound, "reduced")
+            return None
+        self.call_times += 1
+        if self.prune_by_coloring(
+            node.fixed_variables[node.fixed_values == 1],
+            node.fixed_variables[node.fixed_values == 0],
+        ):
+            self.lp_calls_avoided += 1
+            self.trace_node(node.depth, node.bound, "coloring")
+            return None
+        self.apply_fixings(node)
+        if node.basis is not None and not self.is_child(node, self.last_solved_node):
+            self.set_basis(node.basis)
+        solution, objective_value = self.solve_relaxation()
+        self.last_solved_node = node
+        if solution is None:
+            self.trace_node(node.depth, None, "infeasible")
+            return None
+        if self.root_bound is None:
+            self.root_bound = objective_value
+        if node.depth:
+            self.branching_policy.update(
+                int(node.fixed_variables[-1]),
+                int(node.fixed_values[-1]),
+                node.bound - objective_value,
+            )
+        self.run_rounding_heuristic(solution)
+        if floor(objective_value + self.epsilon) <= self.best_found_clique_size:
+            self.trace_node(node.depth, objective_value, "bound")
+            return None
+
+        if self.call_times % 2500 == 0:
+            self.log_progress(objective_value)
+
+        # In DFS the "1" branch is popped right after this node, so cplex already
+        # holds the parent basis for it. The "0" branch is explored after the whole
+        # subtree, so it keeps a copy of the parent basis (taken before strong
+        # branching solves other LPs), unless the queue would drop it
+        basis = None
+        if self.warm_start and self.open_nodes.keeps_bases():
+            basis = self.get_basis()
+        branching_variable = self.find_branching_variable(solution, node.depth)
+
+        if branching_variable is None:
+            self.trace_node(node.depth, objective_value, "integral")
+            if self.is_clique(solution):
+                self.update_incumbent(objective_value, solution)
+            return None
+        self.trace_node(node.depth, objective_value, "branched")
+        return (
+            self.child_node(node, objective_value, branching_variable, 0, basis),
+            self.child_node(node, objective_value, branching_variable, 1, None),
+        )
+
+    def solve(self):
+        if not len(self.open_nodes):
+            self.open_nodes.push(self.root_node())
+        while len(self.open_nodes):
+            self.current_node = None
+            self.check_time()
+            self.maybe_checkpoint()
+            self.current_node = self.open_nodes.pop()
+            children = self.process_node(self.current_node)
+            if children is not None:
+                self.open_nodes.push_children(*children)
+        self.current_node = None
+        return 0
@@ -0,0 +1,164 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+class BranchingPolicy:
+    """
+    Chooses the branching variable among the fractional ones. update is called with
+    the LP bound drop of every solved child, so policies can learn from it. Scores of
+    all variables are written into the solver workspace, which is free once the
+    fractional mask is computed
+    """
+
+    name = None
+
+    def select(self, solver, solution, fractional, depth):
+        raise NotImplementedError
+
+    def update(self, variable, value, bound_drop):
+        pass
+
+
+class ClosestToOneBranching(BranchingPolicy):
+    """
+    The variable closest to 1, fractional values are positive, so masked out ones
+    get 0
+    """
+
+    name = "closest_to_one"
+
+    def select(self, solver, solution, fractional, depth):
+        scores = np.multiply(solution, fractional, out=solver.lp_workspace)
+        return int(np.argmax(scores))
+
+
+class MostFractionalBranching(BranchingPolicy):
+    name = "most_fractional"
+
+    def select(self, solver, solution, fractional, depth):
+        # 0.5 - |x - 0.5| is positive for fractional values
+        scores = np.subtract(solution, 0.5, out=solver.lp_workspace)
+        np.abs(scores, out=scores)
+        np.subtract(0.5, scores, out=scores)
+        np.multiply(scores, fractional, out=scores)
+        return int(np.argmax(scores))
+
+
+class DegreeWeightedBranching(BranchingPolicy):
+    """
+    LP value weighted by the degree: vertices of large degree fixed to 1 shrink
+    the candidate set the least, fixed to 0 remove the most edges
+    """
+
+    name = "degree_weighted"
+
+    def __init__(self):
+        self.weights = None
+
+    def select(self, solver, solution, fractional, depth):
+        if self.weights is None:
+            self.weights = (solver.graph.degrees() + 1).astype(np.float64)
+        scores = np.multiply(solution, self.weights, out=solver.lp_workspace)
+        np.multiply(scores, fractional, out=scores)
+        return int(np.argmax(scores))
+
+
+class PseudoCostBranching(BranchingPolicy):
+    """
+    Average LP bound drop of the "0" and "1" branches per variable, scored with the
+    product rule. Variables which weren't branched on yet get the average over all
+    of them, so the closest to 1 rule decides until something is learned
+    """
+
+    name = "pseudo_cost"
+
+    def __init__(self, min_gain=1e-3):
+        self.min_gain = min_gain
+        # Sums of the bound drops and numbers of the branches, for values 0 and 1
+        self.gains = [defaultdict(float), defaultdict(float)]
+        self.counts = [Counter(), Counter()]
+
+    def update(self, variable, value, bound_drop):
+        self.gains[int(value)][variable] += max(bound_drop, 0.0)
+        self.counts[int(value)][variable] += 1
+
+    def estimate(self, variables, value):
+        gains, counts = self.gains[value], self.counts[value]
+        total_count = sum(counts.values())
+        default = sum(gains.values()) / total_count if total_count else 1.0
+        return np.array(
+            [
+                gains[variable] / counts[variable] if variable in counts else default
+                for variable in variables
+            ],
+        )
+
+    def select(self, solver, solution, fractional, depth):
+        if not self.counts[0] and not self.counts[1]:
+            return ClosestToOneBranching().select(solver, solution, fractional, depth)
+        candidates = np.flatnonzero(fractional)
+        candidates_list = candidates.tolist()
+        score = np.maximum(self.estimate(candidates_list, 0), self.min_gain) * np.maximum(
+            self.estimate(candidates_list, 1), self.min_gain,
+        )
+        return int(candidates[np.argmax(score)])
+
+
+class StrongBranching(PseudoCostBranching):
+    """
+    Up to max_depth the max_candidates variables closest to 1 are evaluated by solving
+    both child LPs, deeper nodes use pseudo-costs learned from these evaluations
+    """
+
+    name = "strong"
+
+    def __init__(self, max_depth=3, max_candidates=8, min_gain=1e-3):
+        super().__init__(min_gain)
+        self.max_depth = max_depth
+        self.max_candidates = max_candidates
+
+    def evaluate(self, solver, variable, value):
+        problem = solver.problem
+        lower_bound = problem.variables.get_lower_bounds(variable)
+        upper_bound = problem.variables.get_upper_bounds(variable)
+        problem.variables.set_lower_bounds(variable, float(value))
+        problem.variables.set_upper_bounds(variable, float(value))
+        try:
+            problem.solve()
+            if problem.solution.is_primal_feasible():
+                return problem.solution.get_objective_value()
+            return 0.0
+        finally:
+            problem.variables.set_lower_bounds(variable, lower_bound)
+            problem.variables.set_upper_bounds(variable, upper_bound)
+
+    def select(self, solver, solution, fractional, depth):
+        if depth > self.max_depth:
+            return super().select(solver, solution, fractional, depth)
+        candidates = np.flatnonzero(fractional)
+        candidates = candidates[np.argsort(-solution[candidates], kind="stable")]
+        candidates = candidates[: self.max_candidates].tolist()
+        bound = float(np.sum(solution))
+        scores = []
+        for variable in candidates:
+            gains = []
+            for value in [0, 1]:
+                bound_drop = bound - self.evaluate(solver, variable, value)
+                self.update(variable, value, bound_drop)
+                gains.append(max(bound_drop, self.min_gain))
+            scores.append(gains[0] * gains[1])
+        solver.strong_branching_lp_calls += 2 * len(candidates)
+        return candidates[int(np.argmax(scores))]
+
+
+BRANCHING_POLICIES = {
+    policy.name: policy
+    for policy in [
+        ClosestToOneBranching,
+        MostFractionalBranching,
+        DegreeWeightedBranching,
+        PseudoCostBranching,
+        StrongBranching,
+    ]
+}
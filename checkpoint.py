@@ -0,0 +1,127 @@
+import logging
+import os
+from time import time
+
+import numpy as np
+
+from bnb_max_clique import Node
+
+
+def flatten(arrays, dtype):
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(array) for array in arrays])
+    values = np.zeros(int(offsets[-1]), dtype=dtype)
+    for idx, array in enumerate(arrays):
+        values[offsets[idx] : offsets[idx + 1]] = array
+    return values, offsets
+
+
+def unflatten(values, offsets):
+    return np.split(values, offsets[1:-1]) if len(offsets) > 1 else []
+
+
+class Checkpointer:
+    """
+    Writes the search state (incumbent, open nodes as flat arrays of fixed variables
+    and values, independent sets) to an .npz file at most once per interval seconds.
+    reduced_nodes maps the solver graph to the original one, if it was reduced
+    """
+
+    def __init__(self, path, interval=300, reduced_nodes=None):
+        self.path = path
+        self.interval = interval
+        self.reduced_nodes = reduced_nodes
+        self.last_save = time()
+        self.write_time = 0.0
+        self.writes_number = 0
+
+    def due(self):
+        return time() - self.last_save >= self.interval
+
+    def save(self, solver):
+        start_time = time()
+        nodes = solver.get_open_nodes()
+        fixed_variables, offsets = flatten(
+            [node.fixed_variables for node in nodes], np.int32,
+        )
+        fixed_values = flatten([node.fixed_values for node in nodes], np.int8)[0]
+        ind_set_vertices, ind_set_offsets = flatten(solver.independent_sets, np.int32)
+        best_solution = solver.get_solution()
+        state = {
+            "graph_hash": np.array(solver.graph.content_hash()),
+            "best_found_clique_size": np.array(solver.best_found_clique_size),
+            "best_solution": np.asarray(
+                [] if best_solution is None else best_solution, dtype=np.float64,
+            ),
+            "root_bound": np.array(
+                np.nan if solver.root_bound is None else solver.root_bound,
+            ),
+            "node_bounds": np.array([node.bound for node in nodes], dtype=np.float64),
+            "node_depths": np.array([node.depth for node in nodes], dtype=np.int32),
+            "node_offsets": offsets,
+            "fixed_variables": fixed_variables,
+            "fixed_values": fixed_values,
+            "ind_set_vertices": ind_set_vertices,
+            "ind_set_offsets": ind_set_offsets,
+        }
+        if self.reduced_nodes is not None:
+            state["reduced_nodes"] = np.asarray(self.reduced_nodes, dtype=np.int64)
+        try:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fp:
+                np.savez(fp, **state)
+            os.replace(tmp_path, self.path)
+        except OSError as msg:
+            logging.warning(f"Failed to write the checkpoint: {msg}")
+            return
+        finally:
+            self.last_save = time()
+        self.writes_number += 1
+        self.write_time += self.last_save - start_time
+        logging.info(
+            f"Checkpoint with {len(nodes)} open nodes written in {self.last_save - start_time:.3f} secs "
+            f"({os.path.getsize(self.path) / 1024:.1f} KB), total checkpoint time: {self.write_time:.3f} secs",
+        )
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_checkpoint(path):
+    with np.load(path) as data:
+        nodes = [
+            Node(
+                bound=float(bound),
+                depth=int(depth),
+                fixed_variables=fixed_variables,
+                fixed_values=fixed_values,
+                basis=None,
+            )
+            for bound, depth, fixed_variables, fixed_values in zip(
+                data["node_bounds"].tolist(),
+                data["node_depths"].tolist(),
+                unflatten(data["fixed_variables"], data["node_offsets"]),
+                unflatten(data["fixed_values"], data["node_offsets"]),
+            )
+        ]
+        independent_sets = [
+            tuple(ind_set.tolist())
+            for ind_set in unflatten(data["ind_set_vertices"], data["ind_set_offsets"])
+        ]
+        root_bound = float(data["root_bound"])
+        best_solution = data["best_solution"]
+        checkpoint = {
+            "graph_hash": str(data["graph_hash"]),
+            "best_found_clique_size": float(data["best_found_clique_size"]),
+            "best_solution": best_solution if len(best_solution) else None,
+            "root_bound": None if np.isnan(root_bound) else root_bound,
+            "nodes": nodes,
+            "independent_sets": independent_sets,
+            "reduced_nodes": data["reduced_nodes"] if "reduced_nodes" in data else None,
+        }
+    logging.info(
+        f"Loaded checkpoint {path} with {len(nodes)} open nodes, "
+        f"incumbent: {checkpoint['best_found_clique_size']}",
+    )
+    return checkpoint
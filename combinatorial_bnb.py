@@ -0,0 +1,192 @@
+import logging
+from time import time
+
+import numpy as np
+
+from heuristic import GreedyHeuristic
+from utils import SearchResultsMixin, check_clique, time_it
+
+
+class ColoringBnBCliqueSolver(SearchResultsMixin):
+    """
+    CPLEX-free max clique BnB on bitsets (MCS/BBMC style). Vertices are relabelled in
+    the reversed degeneracy order, every node greedily colors its candidates class by
+    class and branches on the vertices of the largest colors first: the clique size
+    plus the color of a vertex bounds every clique which can be built from it and the
+    vertices before it. Vertices which would get a color large enough to be branched on
+    are re-numbered into smaller classes when they conflict with a single vertex there
+    """
+
+    def __init__(self, graph, time_limit, recoloring=True):
+        self.graph = graph
+        self.time_limit = time_limit
+        self.recoloring = recoloring
+        self.timer = time()
+        self.search_timer = None
+        self.best_found_clique_size = 0
+        self.best_solution = None
+        self.call_times = 0
+        self.recolored_vertices = 0
+        self.root_bound = None
+        self.search_finished = False
+        self.best_found_time = None
+        # Bit i of the rows is the i-th vertex of the initial order
+        self.order = graph.degeneracy_order()[0][::-1]
+        self.int_rows = graph.subgraph(self.order).int_rows()
+
+    def check_time(self):
+        if time() - self.timer >= self.time_limit:
+            raise TimeoutError
+
+    def renumber(self, vertex, color_classes, min_color):
+        """
+        Moves the vertex into a class below min_color where it has a single neighbor,
+        which is moved to another class below min_color without neighbors of it
+        """
+        int_rows = self.int_rows
+        for first_color in range(min_color):
+            conflicts = color_classes[first_color] & int_rows[vertex]
+            if not conflicts:  # Its neighbors were re-numbered out of the class
+                color_classes[first_color] |= 1 << vertex
+                return True
+            if conflicts & (conflicts - 1):
+                continue  # More than one neighbor
+            conflicting_vertex = conflicts.bit_length() - 1
+            for second_color in range(min_color):
+                if second_color == first_color:
+                    continue
+                if not color_classes[second_color] & int_rows[conflicting_vertex]:
+                    color_classes[second_color] |= conflicts
+                    color_classes[first_color] ^= conflicts | (1 << vertex)
+                    return True
+        return False
+
+    def color_sort(self, candidates, clique_size):
+        """
+        Greedy coloring of the candidates (python int bitset). Returns vertices with
+        colors which may improve the incumbent and their colors, sorted by color
+        """
+        int_rows = self.int_rows
+        # Vertices of the first min_color classes are never branched on
+        min_color = max(self.best_found_clique_size - clique_size, 0)
+        color_classes = []
+        vertices, colors = [], []
+        uncolored = candidates
+        while uncolored:
+            color_class = 0
+            available = uncolored
+            while available:
+                lowest = available & -available
+                color_class |= lowest
+                available &= ~(int_rows[lowest.bit_length() - 1] | lowest)
+            uncolored &= ~color_class
+            if len(color_classes) >= min_color:
+                if self.recoloring and min_color:
+                    remaining = color_class
+                    while remaining:
+                        lowest = remaining & -remaining
+                        remaining ^= lowest
+                        vertex = lowest.bit_length() - 1
+                        if self.renumber(vertex, color_classes, min_color):
+                            color_class ^= lowest
+                            self.recolored_vertices += 1
+                    if not color_class:
+                        continue
+                color = len(color_classes) + 1
+                remaining = color_class
+                while remaining:
+                    lowest = remaining & -remaining
+                    remaining ^= lowest
+                    vertices.append(lowest.bit_length() - 1)
+                    colors.append(color)
+            color_classes.append(color_class)
+        return vertices, colors
+
+    def solve(self):
+        """
+        Depth-first search with an explicit stack of [vertices, colors, candidates]
+        frames, the i-th frame extends the first i vertices of the clique
+        """
+        int_rows = self.int_rows
+        all_vertices = (1 << len(int_rows)) - 1
+        clique = []
+        stack = [[*self.color_sort(all_vertices, 0), all_vertices]]
+        while stack:
+            vertices, colors, candidates = stack[-1]
+            if not vertices or len(clique) + colors[-1] <= self.best_found_clique_size:
+                stack.pop()
+                if stack:
+                    clique.pop()
+                continue
+            if len(stack) == 1:
+                # The rest of the tree is under the root vertices with smaller colors
+                self.root_bound = colors[-1]
+            vertex = vertices.pop()
+            colors.pop()
+            stack[-1][2] = candidates & ~(1 << vertex)
+            clique.append(vertex)
+            new_candidates = candidates & int_rows[vertex]
+            if not new_candidates:
+                if len(clique) > self.best_found_clique_size:
+                    self.update_incumbent(clique)
+                clique.pop()
+                continue
+            self.call_times += 1
+            if self.call_times % 1000 == 0:
+                self.check_time()
+            if self.call_times % 100000 == 0:
+                self.log_progress(len(clique))
+            stack.append([*self.color_sort(new_candidates, len(clique)), new_candidates])
+        return 0
+
+    def update_incumbent(self, clique):
+        self.best_found_clique_size = len(clique)
+        self.best_found_time = time()
+        self.best_solution = np.zeros(self.graph.number_of_nodes())
+        self.best_solution[self.order[clique]] = 1
+        logging.info(f"Found clique of size {self.best_found_clique_size}")
+
+    @time_it
+    def __call__(self):
+        if self.best_solution is None and self.graph.number_of_nodes():
+            solution, objective_value = GreedyHeuristic(self.graph)()
+            if objective_value > self.best_found_clique_size:
+                self.best_found_clique_size = objective_value
+                self.best_solution = solution
+        self.search_timer = time()
+        try:
+            result = self.solve()
+            self.search_finished = True
+            return result
+        finally:
+            self.log_search_statistics()
+            if self.best_solution is not None and not check_clique(
+                self.graph, self.best_solution,
+            )[0]:
+                logging.warning("Coloring BnB solution is not a clique!")
+
+    def log_progress(self, depth):
+        logging.info(
+            f"Total Call times: {self.call_times}, Best Found Solution: {self.best_found_clique_size}, "
+            f"Depth: {depth}, Nodes/sec: {self.get_nodes_per_second():.2f}",
+        )
+
+    def get_search_statistics(self):
+        return {"Nodes": self.call_times, "Time To Best (sec.)": self.get_time_to_best()}
+
+    def log_search_statistics(self):
+        logging.info(
+            f"Explored {self.call_times} nodes, {self.get_nodes_per_second():.2f} nodes/sec, "
+            f"{self.recolored_vertices} vertices re-numbered",
+        )
+        logging.info(f"Best bound: {self.get_best_bound()}, gap: {self.get_gap()}")
+
+    def get_open_nodes_bound(self):
+        # Open nodes are under the root vertices with colors up to the root bound
+        return self.root_bound
+
+    def get_solution(self):
+        return self.best_solution
+
+    def set_solution(self, solution):
+        self.best_solution = solution
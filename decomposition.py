@@ -0,0 +1,325 @@
+import logging
+import queue
+from itertools import chain
+from math import floor
+from time import time
+
+import numpy as np
+
+from bnb_max_clique import BnBCliqueSolver
+from independent_sets import IndependentSetGenerator
+from parallel_bnb import (
+    SPAWN_CONTEXT,
+    check_reports,
+    drain_queue,
+    get_best_report,
+    raise_for_reports,
+    run_pool,
+)
+from reduction import peel_vertices
+from utils import SearchResultsMixin, quiet_logging, time_it
+
+
+def get_subproblems(graph):
+    """
+    Every clique lies in {v} + the neighbors of v which come later in the degeneracy
+    order, where v is its first vertex. Returns (v, later neighbors) pairs sorted by
+    decreasing size
+    """
+    order = graph.degeneracy_order()[0]
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    subproblems = []
+    for vertex in order.tolist():
+        neighbors = graph.neighbors(vertex)
+        subproblems.append((vertex, neighbors[position[neighbors] > position[vertex]]))
+    subproblems.sort(key=lambda subproblem: -len(subproblem[1]))
+    return subproblems
+
+
+class RestrictedIndependentSets:
+    """
+    Independent sets of the whole graph, stored per vertex, so the rows of a
+    neighborhood are taken from them instead of being generated for every subproblem
+    """
+
+    def __init__(self, independent_sets, num_nodes):
+        members = np.fromiter(
+            chain.from_iterable(independent_sets),
+            dtype=np.int64,
+            count=sum(len(ind_set) for ind_set in independent_sets),
+        )
+        set_ids = np.repeat(
+            np.arange(len(independent_sets)),
+            [len(ind_set) for ind_set in independent_sets],
+        )
+        order = np.argsort(members, kind="stable")
+        self.set_ids = set_ids[order]
+        # Sets of vertex v are set_ids[offsets[v]:offsets[v + 1]]
+        self.offsets = np.searchsorted(members[order], np.arange(num_nodes + 1))
+
+    @classmethod
+    def from_colorings(cls, graph):
+        """
+        Maximal independent sets from the deterministic colorings, they need no LP
+        """
+        start_time = time()
+        generator = IndependentSetGenerator(graph, float("inf"))
+        independent_sets = generator.collect(generator.deterministic_classes(), set())
+        logging.info(
+            f"Found {len(independent_sets)} independent sets of the whole graph in "
+            f"{time() - start_time:.3f} secs",
+        )
+        return cls(independent_sets, graph.number_of_nodes())
+
+    def restrict(self, vertices):
+        """
+        Intersections (with 2 vertices or more) of the sets with the vertices, in the
+        ids of the subgraph induced by them
+        """
+        starts = self.offsets[vertices]
+        counts = self.offsets[vertices + 1] - starts
+        if not counts.sum():
+            return []
+        positions = np.concatenate(
+            [np.arange(start, start + count) for start, count in zip(starts, counts)],
+        )
+        local = np.repeat(np.arange(len(vertices)), counts)
+        set_ids = self.set_ids[positions]
+        order = np.lexsort((local, set_ids))
+        set_ids, local = set_ids[order], local[order]
+        groups = np.split(local, np.flatnonzero(np.diff(set_ids)) + 1)
+        return sorted({tuple(group.tolist()) for group in groups if len(group) > 1})
+
+
+class NeighborhoodSolver:
+    """
+    Solves subproblems against an incumbent kept in the original vertex ids
+    """
+
+    def __init__(self, graph, solve_type, deadline, options, independent_sets=None):
+        self.graph = graph
+        self.solve_type = solve_type
+        self.deadline = deadline
+        self.options = options
+        self.independent_sets = independent_sets
+        self.best_found_clique_size = 0
+        self.best_solution = None
+        self.solved_number = 0
+        self.skipped_number = 0
+        self.interrupted_bound = None
+
+    def solve(self, vertex, neighbors):
+        """
+        Searches for a clique larger than the incumbent containing the vertex and its
+        later neighbors only
+        """
+        # Clique in the neighborhood has to be larger than incumbent - 1
+        lower_bound = floor(self.best_found_clique_size + 1e-3) - 1
+        if len(neighbors) <= lower_bound:
+            self.skipped_number += 1
+            return
+        subgraph = self.graph.subgraph(neighbors)
+        alive = peel_vertices(subgraph, lower_bound)
+        if alive.sum() <= lower_bound:
+            self.skipped_number += 1
+            return
+        neighbors = neighbors[alive]
+        self.solved_number += 1
+        if not len(neighbors):
+            self.update_incumbent([vertex])
+            return
+        start_time = time()
+        # Subproblem solvers log at debug level, there may be thousands of them
+        with quiet_logging():
+            solver = BnBCliqueSolver(
+                subgraph.subgraph(np.flatnonzero(alive)),
+                self.solve_type,
+                self.deadline - time(),
+                independent_sets=None
+                if self.independent_sets is None
+                else self.independent_sets.restrict(neighbors),
+                **self.options,
+            )
+        solver.set_objective_value(lower_bound)
+        try:
+            with quiet_logging():
+                solver()
+        except TimeoutError:
+            best_bound = solver.get_best_bound()
+            self.interrupted_bound = (
+                len(neighbors) + 1 if best_bound is None else best_bound + 1
+            )
+            raise
+        finally:
+            logging.debug(
+                f"Neighborhood of {vertex}: {len(neighbors)} vertices, {solver.call_times} "
+                f"nodes, {time() - start_time:.3f} secs",
+            )
+            solution = solver.get_solution()
+            if solution is not None and solver.get_objective_value() > lower_bound:
+                clique = neighbors[np.isclose(solution, 1.0, atol=1e-4)]
+                self.update_incumbent([vertex, *clique.tolist()])
+
+    def update_incumbent(self, clique):
+        if len(clique) <= self.best_found_clique_size:
+            return
+        self.best_found_clique_size = len(clique)
+        self.best_solution = np.zeros(self.graph.number_of_nodes())
+        self.best_solution[clique] = 1
+        logging.info(f"Decomposition found clique of size {self.best_found_clique_size}")
+
+
+def run_worker(
+    graph, solve_type, deadline, options, independent_sets, incumbent, tasks, results,
+):
+    solver = NeighborhoodSolver(
+        graph, solve_type, deadline, options, independent_sets,
+    )
+    report = {"timed_out": False, "error": None, "open_bounds": []}
+    try:
+        while True:
+            try:
+                task = tasks.get(timeout=1)
+            except queue.Empty:
+                break
+            if incumbent.value > solver.best_found_clique_size:
+                solver.best_found_clique_size = incumbent.value
+                solver.best_solution = None  # Kept by the worker which found it
+            solver.solve(*task)
+            with incumbent.get_lock():
+                incumbent.value = max(incumbent.value, solver.best_found_clique_size)
+    except TimeoutError:
+        report["timed_out"] = True
+        report["open_bounds"].append(solver.interrupted_bound)
+    except Exception as msg:
+        report["error"] = str(msg)
+    report["best_found_clique_size"] = solver.best_found_clique_size
+    report["best_solution"] = solver.best_solution
+    report["solved_number"] = solver.solved_number
+    report["skipped_number"] = solver.skipped_number
+    results.put(report)
+
+
+class DecompositionCliqueSolver(SearchResultsMixin):
+    """
+    Splits the search into one small LP BnB per vertex neighborhood of the degeneracy
+    order, largest first. Neighborhoods which can't beat the incumbent are skipped,
+    with several workers they are solved by a process pool sharing the incumbent.
+    Their independent set rows are the sets of the whole graph restricted to them
+    """
+
+    def __init__(
+        self, graph, solve_type, time_limit, debug=False, workers=1, **options,
+    ):
+        self.graph = graph
+        self.solve_type = solve_type
+        self.time_limit = time_limit
+        self.workers = workers
+        self.options = dict(options, debug=debug)
+        self.timer = time()
+        self.best_found_clique_size = 0
+        self.best_solution = None
+        self.search_finished = False
+        self.open_bound = None
+        self.solved_number = 0
+        self.skipped_number = 0
+        self.independent_sets = None
+
+    def solve_sequentially(self, subproblems):
+        solver = NeighborhoodSolver(
+            self.graph,
+            self.solve_type,
+            self.timer + self.time_limit,
+            self.options,
+            self.independent_sets,
+        )
+        solver.best_found_clique_size = self.best_found_clique_size
+        try:
+            for vertex, neighbors in subproblems:
+                # Subproblems are sorted, so the current one bounds the rest
+                self.open_bound = len(neighbors) + 1
+                solver.solve(vertex, neighbors)
+        finally:
+            if solver.best_solution is not None:
+                self.best_found_clique_size = solver.best_found_clique_size
+                self.best_solution = solver.best_solution
+            self.solved_number = solver.solved_number
+            self.skipped_number = solver.skipped_number
+            logging.info(
+                f"Solved {self.solved_number} neighborhoods, skipped {self.skipped_number}",
+            )
+
+    def solve_in_pool(self, subproblems):
+        incumbent = SPAWN_CONTEXT.Value("d", self.best_found_clique_size)
+        tasks = SPAWN_CONTEXT.Queue()
+        for subproblem in subproblems:
+            tasks.put(subproblem)
+        reports = run_pool(
+            run_worker,
+            (
+                self.graph,
+                self.solve_type,
+                self.timer + self.time_limit,
+                self.options,
+                self.independent_sets,
+                incumbent,
+                tasks,
+            ),
+            self.workers,
+        )
+        open_bounds = [
+            bound for report in reports for bound in report["open_bounds"] if bound
+        ]
+        best_report = get_best_report(
+            reports, self.best_found_clique_size, "best_solution",
+        )
+        if best_report is not None:
+            self.best_found_clique_size = best_report["best_found_clique_size"]
+            self.best_solution = best_report["best_solution"]
+        open_bounds.extend(len(task[1]) + 1 for task in drain_queue(tasks))
+        self.solved_number = sum(report["solved_number"] for report in reports)
+        self.skipped_number = sum(report["skipped_number"] for report in reports)
+        logging.info(
+            f"Solved {self.solved_number} neighborhoods, skipped {self.skipped_number}",
+        )
+        failed = check_reports(reports, self.workers)
+        if failed and subproblems:
+            # Subproblems of the failed workers are lost
+            open_bounds.append(len(subproblems[0][1]) + 1)
+        self.open_bound = max(open_bounds) if open_bounds else None
+        raise_for_reports(reports, failed)
+
+    def solve(self):
+        self.independent_sets = RestrictedIndependentSets.from_colorings(self.graph)
+        subproblems = get_subproblems(self.graph)
+        logging.info(
+            f"Decomposed the graph into {len(subproblems)} neighborhoods, the largest has "
+            f"{len(subproblems[0][1]) if subproblems else 0} vertices",
+        )
+        if self.workers > 1:
+            self.solve_in_pool(subproblems)
+        else:
+            self.solve_sequentially(subproblems)
+        return 0
+
+    @time_it
+    def __call__(self):
+        result = self.solve()
+        self.search_finished = True
+        return result
+
+    def get_search_statistics(self):
+        return {
+            "Solved Neighborhoods": self.solved_number,
+            "Skipped Neighborhoods": self.skipped_number,
+        }
+
+    def get_open_nodes_bound(self):
+        return self.open_bound
+
+    def get_solution(self):
+        return self.best_solution
+
+    def set_solution(self, solution):
+        self.best_solution = solution
@@ -1,10 +1,14 @@
+import logging
+from collections import deque
+from time import time
+
 import numpy as np
 
 from utils import read_graph
 
 
 class GreedyHeuristic:
-    def __init__(self, graph, iterations_number=150, top_k=5):
+    def __init__(self, graph, iterations_number=150, top_k=5, seed=None):
         self.graph = graph
         self.strategies = [
             self.largest_first,
@@ -14,6 +18,9 @@ class GreedyHeuristic:
         ]
         self.top_k = top_k
         self.iterations_number = iterations_number
+        self.random_state = np.random.RandomState(seed)
+        self.adjacency = graph.to_dense()
+        self._smallest_degree_last_order = None
 
     def solve(self):
         best_clique = 0
@@ -30,83 +37,286 @@ class GreedyHeuristic:
     def __call__(self):
         return self.solve()
 
-    def largest_first(self):
+    def largest_first_order(self):
+        return np.argsort(-self.graph.degrees(), kind="stable")
+
+    def smallest_degree_last_order(self):
+        # Degeneracy order is computed once and shared by both strategies
+        if self._smallest_degree_last_order is None:
+            self._smallest_degree_last_order = self.graph.degeneracy_order()[0][::-1]
+        return self._smallest_degree_last_order
+
+    def greedy_clique(self, order):
+        """
+        Takes the first candidate in the order and keeps its neighbors as candidates
+        """
+        adjacency = self.adjacency[np.ix_(order, order)]
+        candidates = np.ones(len(order), dtype=bool)
         solution = []
-        sorted_nodes = sorted(self.graph.degree(), key=lambda x: x[1], reverse=True)
-        while len(sorted_nodes) > 0:
-            current_node = sorted_nodes[0][0]
-            solution.append(current_node)
-            node_neighbours = list(self.graph.neighbors(current_node))
-            sorted_nodes.pop(0)
-            sorted_nodes = list(filter(lambda x: x[0] in node_neighbours, sorted_nodes))
+        while candidates.any():
+            position = int(np.argmax(candidates))
+            solution.append(order[position])
+            candidates &= adjacency[position]
         return solution
 
+    def randomized_greedy_clique(self, order):
+        """
+        Runs iterations_number randomized constructions at once: on every step each of
+        them takes a random candidate among the top_k first ones in the order
+        """
+        adjacency = self.adjacency[np.ix_(order, order)]
+        candidates = np.ones((self.iterations_number, len(order)), dtype=bool)
+        taken = np.zeros_like(candidates)
+        while True:
+            candidates_number = candidates.sum(axis=1)
+            active = np.flatnonzero(candidates_number)
+            if not len(active):
+                break
+            rank = self.random_state.randint(
+                0, np.minimum(self.top_k, candidates_number[active]),
+            )
+            positions = np.argmax(
+                np.cumsum(candidates[active], axis=1) > rank[:, None], axis=1,
+            )
+            taken[active, positions] = True
+            candidates[active] &= adjacency[positions]
+        best_iteration = np.argmax(taken.sum(axis=1))
+        return order[np.flatnonzero(taken[best_iteration])].tolist()
+
+    def largest_first(self):
+        return self.greedy_clique(self.largest_first_order())
+
     def largest_first_randomized(self):
-        best_solution = None
-        best_clique = 0
-        sorted_nodes = sorted(self.graph.degree(), key=lambda x: x[1], reverse=True)
-        for _ in range(self.iterations_number):
-            solution = []
-            sorted_nodes_copy = sorted_nodes.copy()
-            while len(sorted_nodes_copy) > 0:
-                random_index = np.random.randint(
-                    0, min(self.top_k, len(sorted_nodes_copy)),
-                )
-                current_node = sorted_nodes_copy[random_index][0]
-                solution.append(current_node)
-                node_neighbours = list(self.graph.neighbors(current_node))
-                sorted_nodes_copy.pop(0)
-                sorted_nodes_copy = list(
-                    filter(lambda x: x[0] in node_neighbours, sorted_nodes_copy),
-                )
-            if len(solution) > best_clique:
-                best_solution = solution
-                best_clique = len(solution)
-        return best_solution
+        return self.randomized_greedy_clique(self.largest_first_order())
 
     def smallest_degree_last_with_remove(self):
-        solution = []
-        graph = self.graph.copy()
-        sorted_nodes = []
-        while graph.number_of_nodes():
-            sorted_nodes.append(min(graph.degree(), key=lambda x: x[1]))
-            graph.remove_node(sorted_nodes[-1][0])
-        sorted_nodes = list(reversed(sorted_nodes))
-        while len(sorted_nodes) > 0:
-            current_node = sorted_nodes[0][0]
-            solution.append(current_node)
-            node_neighbours = list(self.graph.neighbors(current_node))
-            sorted_nodes.pop(0)
-            sorted_nodes = list(filter(lambda x: x[0] in node_neighbours, sorted_nodes))
-        return solution
+        return self.greedy_clique(self.smallest_degree_last_order())
 
     def smallest_degree_last_with_remove_randomized(self):
-        best_solution = None
-        best_clique = 0
-        sorted_nodes = []
-        graph = self.graph.copy()
-        while graph.number_of_nodes():
-            sorted_nodes.append(min(graph.degree(), key=lambda x: x[1]))
-            graph.remove_node(sorted_nodes[-1][0])
-        sorted_nodes = list(reversed(sorted_nodes))
-        for _ in range(self.iterations_number):
-            solution = []
-            sorted_nodes_copy = sorted_nodes.copy()
-            while len(sorted_nodes_copy) > 0:
-                random_index = np.random.randint(
-                    0, min(self.top_k, len(sorted_nodes_copy)),
-                )
-                current_node = sorted_nodes_copy[random_index][0]
-                solution.append(current_node)
-                node_neighbours = list(self.graph.neighbors(current_node))
-                sorted_nodes_copy.pop(0)
-                sorted_nodes_copy = list(
-                    filter(lambda x: x[0] in node_neighbours, sorted_nodes_copy),
-                )
-            if len(solution) > best_clique:
-                best_solution = solution
-                best_clique = len(solution)
-        return best_solution
+        return self.randomized_greedy_clique(self.smallest_degree_last_order())
+
+
+class IndexedSet:
+    """
+    Set with O(1) add, discard and uniform sampling
+    """
+
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.positions = {item: position for position, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def sample(self, random_state):
+        return self.items[random_state.randint(len(self.items))]
+
+
+class IteratedLocalSearchHeuristic:
+    """
+    Iterated local search for cliques: add moves, (1, 1)-swaps guarded by a tabu list
+    and random kicks as perturbation. missing[v] counts clique vertices which aren't
+    adjacent to v, so adding or removing a vertex only updates its complement
+    neighborhood, together with the sets of non-tabu vertices outside the clique
+    missing 0 (add candidates) and 1 (swap candidates). Tabu vertices return to the
+    sets when their tenure expires. The search stops after max_stagnation iterations
+    without improvement or when it's out of time
+    """
+
+    def __init__(
+        self,
+        graph,
+        time_limit=10,
+        initial_solution=None,
+        tabu_tenure=7,
+        max_swaps=100,
+        restart_frequency=50,
+        max_stagnation=1000,
+        seed=None,
+    ):
+        self.graph = graph
+        self.time_limit = time_limit
+        self.tabu_tenure = tabu_tenure
+        self.max_swaps = max_swaps
+        self.restart_frequency = restart_frequency
+        self.max_stagnation = max_stagnation
+        self.random_state = np.random.RandomState(seed)
+        num_nodes = graph.number_of_nodes()
+        self.non_neighbors = [
+            np.flatnonzero(row) for row in graph.complement().to_dense()
+        ]
+        self.non_neighbors_lists = [
+            non_neighbors.tolist() for non_neighbors in self.non_neighbors
+        ]
+        self.in_clique = np.zeros(num_nodes, dtype=bool)
+        self.clique_size = 0
+        self.missing = [0] * num_nodes
+        # Non-tabu vertices outside the clique with 0 and 1 missing edges to it
+        self.candidates = [IndexedSet(range(num_nodes)), IndexedSet()]
+        self.tabu_until = [0] * num_nodes
+        # (step when the tabu expires, vertex) in the order of expiration
+        self.tabu_expirations = deque()
+        self.step = 0
+        self.best_clique = np.empty(0, dtype=np.int64)
+        if initial_solution is not None:
+            self.best_clique = np.flatnonzero(
+                np.isclose(np.asarray(initial_solution), 1.0, atol=1e-4),
+            )
+
+    def is_candidate(self, node):
+        return (
+            self.missing[node] <= 1
+            and not self.in_clique[node]
+            and self.tabu_until[node] <= self.step
+        )
+
+    def shift_missing(self, node, delta):
+        missing = self.missing[node]
+        if missing <= 1:
+            self.candidates[missing].discard(node)
+        self.missing[node] = missing + delta
+        if self.is_candidate(node):
+            self.candidates[missing + delta].add(node)
+
+    def add(self, node):
+        self.in_clique[node] = True
+        self.clique_size += 1
+        if self.missing[node] <= 1:
+            self.candidates[self.missing[node]].discard(node)
+        for other in self.non_neighbors_lists[node]:
+            self.shift_missing(other, 1)
+
+    def remove(self, node):
+        self.in_clique[node] = False
+        self.clique_size -= 1
+        for other in self.non_neighbors_lists[node]:
+            self.shift_missing(other, -1)
+        self.tabu_until[node] = self.step + self.tabu_tenure
+        self.tabu_expirations.append((self.tabu_until[node], node))
+
+    def release_tabu(self):
+        expirations = self.tabu_expirations
+        while expirations and expirations[0][0] <= self.step:
+            expiration, node = expirations.popleft()
+            # Skipped if the vertex was made tabu again since
+            if expiration == self.tabu_until[node] and self.is_candidate(node):
+                self.candidates[self.missing[node]].add(node)
+
+    def set_clique(self, clique):
+        num_nodes = self.graph.number_of_nodes()
+        self.in_clique[:] = False
+        self.clique_size = 0
+        self.missing = [0] * num_nodes
+        self.candidates = [
+            IndexedSet(
+                node for node in range(num_nodes) if self.tabu_until[node] <= self.step
+            ),
+            IndexedSet(),
+        ]
+        for node in clique:
+            self.add(int(node))
+
+    def local_search(self):
+        swaps = 0
+        while True:
+            self.step += 1
+            self.release_tabu()
+            if len(self.candidates[0]):
+                self.add(self.candidates[0].sample(self.random_state))
+                continue
+            if not len(self.candidates[1]) or swaps >= self.max_swaps:
+                return
+            node = self.candidates[1].sample(self.random_state)
+            non_neighbors = self.non_neighbors[node]
+            self.remove(int(non_neighbors[self.in_clique[non_neighbors]][0]))
+            self.add(node)
+            swaps += 1
+
+    def perturb(self):
+        # Forces a random vertex outside the clique into it and drops its non-neighbors
+        num_nodes = self.graph.number_of_nodes()
+        if self.clique_size == num_nodes:
+            return
+        node = self.random_state.randint(num_nodes)
+        while self.in_clique[node]:  # The clique is small, a few draws are enough
+            node = self.random_state.randint(num_nodes)
+        non_neighbors = self.non_neighbors[node]
+        for clique_node in non_neighbors[self.in_clique[non_neighbors]].tolist():
+            self.remove(clique_node)
+        self.add(node)
+
+    def solve(self):
+        timer = time()
+        self.set_clique(self.best_clique)
+        iterations_number = 0
+        last_improvement = 0
+        while time() - timer < self.time_limit:
+            iterations_number += 1
+            if iterations_number - last_improvement > self.max_stagnation:
+                break
+            self.local_search()
+            if self.clique_size > len(self.best_clique):
+                self.best_clique = np.flatnonzero(self.in_clique)
+                last_improvement = iterations_number
+            if iterations_number % self.restart_frequency == 0:
+                self.set_clique(self.best_clique)
+            self.perturb()
+        logging.info(
+            f"ILS made {iterations_number} iterations ({self.step} moves), best clique: {len(self.best_clique)}",
+        )
+        nodes_solution = np.zeros(self.graph.number_of_nodes())
+        nodes_solution[self.best_clique] = 1
+        return nodes_solution, len(self.best_clique)
+
+    def __call__(self):
+        return self.solve()
+
+
+class LPRoundingHeuristic(IteratedLocalSearchHeuristic):
+    """
+    Primal heuristic for the BnB nodes: takes vertices by decreasing LP value (larger
+    degree first on ties) while they are adjacent to all taken ones, then polishes the
+    clique with a local search limited to max_swaps swaps
+    """
+
+    def __init__(self, graph, max_swaps=10, seed=None):
+        super().__init__(graph, time_limit=0, max_swaps=max_swaps, seed=seed)
+        self.int_rows = graph.int_rows()
+        self.degrees = graph.degrees()
+
+    def round(self, lp_solution):
+        candidates = (1 << self.graph.number_of_nodes()) - 1
+        clique = []
+        for node in np.lexsort((-self.degrees, -np.asarray(lp_solution))).tolist():
+            if candidates >> node & 1:
+                clique.append(node)
+                candidates &= self.int_rows[node]
+                if not candidates:
+                    break
+        return clique
+
+    def __call__(self, lp_solution):
+        self.set_clique(self.round(lp_solution))
+        self.local_search()
+        nodes_solution = self.in_clique.astype(np.float64)
+        return nodes_solution, int(self.in_clique.sum())
 
 
 def test_heuristic():
@@ -0,0 +1,212 @@
+import logging
+import os
+from time import time
+
+import networkx as nx
+import numpy as np
+
+# Strategies which give the same coloring on every run
+DETERMINISTIC_STRATEGIES = [
+    nx.coloring.strategy_largest_first,
+    nx.coloring.strategy_connected_sequential_bfs,
+    nx.coloring.strategy_connected_sequential_dfs,
+    nx.coloring.strategy_saturation_largest_first,
+    nx.coloring.strategy_smallest_last,
+]
+
+
+class IndependentSetCache:
+    """
+    On-disk cache of independent set families keyed by the graph hash. Every family is
+    an .npz file (concatenated sets + offsets), the least recently used files are
+    removed when there are more than max_entries of them
+    """
+
+    def __init__(self, cache_dir, max_entries=64):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def get_path(self, graph):
+        return os.path.join(self.cache_dir, f"{graph.content_hash()}.npz")
+
+    def load(self, graph):
+        path = self.get_path(graph)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                vertices, offsets = data["vertices"], data["offsets"]
+        except (OSError, KeyError, ValueError) as msg:
+            logging.warning(f"Failed to load cached independent sets: {msg}")
+            return None
+        os.utime(path)  # Recently used
+        return [
+            tuple(ind_set.tolist()) for ind_set in np.split(vertices, offsets[1:-1])
+        ]
+
+    def save(self, graph, independent_sets):
+        lengths = [len(ind_set) for ind_set in independent_sets]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        vertices = np.fromiter(
+            (vertex for ind_set in independent_sets for vertex in ind_set),
+            dtype=np.int32,
+            count=int(offsets[-1]),
+        )
+        path = self.get_path(graph)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fp:
+                np.savez(fp, vertices=vertices, offsets=offsets)
+            os.replace(tmp_path, path)
+            self.evict()
+        except OSError as msg:
+            logging.warning(f"Failed to cache independent sets: {msg}")
+
+    def evict(self):
+        paths = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(".npz")
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_entries :]:
+            os.remove(path)
+
+
+class IndependentSetGenerator:
+    """
+    Independent sets for the clique LP rows. Deterministic networkx colorings are run
+    once, then random sequential colorings are sampled until the LP bound with the
+    rows generated so far stops improving. Every color class is greedily extended to
+    a maximal independent set
+    """
+
+    def __init__(
+        self,
+        graph,
+        time_limit,
+        cache=None,
+        min_bound_improvement=1e-3,
+        patience=2,
+        max_rounds=100,
+        seed=None,
+    ):
+        self.graph = graph
+        self.time_limit = time_limit
+        self.cache = cache
+        self.min_bound_improvement = min_bound_improvement
+        self.patience = patience
+        self.max_rounds = max_rounds
+        self.random_state = np.random.RandomState(seed)
+        self.int_rows = graph.int_rows()
+        self.all_vertices = (1 << graph.number_of_nodes()) - 1
+
+    def extend(self, ind_set):
+        """
+        Adds vertices non-adjacent to the whole set (lowest ids first) until it's maximal
+        """
+        candidates = self.all_vertices & ~ind_set
+        remaining = ind_set
+        while remaining:
+            lowest = remaining & -remaining
+            remaining ^= lowest
+            candidates &= ~self.int_rows[lowest.bit_length() - 1]
+        while candidates:
+            lowest = candidates & -candidates
+            ind_set |= lowest
+            candidates &= ~(self.int_rows[lowest.bit_length() - 1] | lowest)
+        return ind_set
+
+    def to_tuple(self, ind_set):
+        vertices = []
+        while ind_set:
+            lowest = ind_set & -ind_set
+            ind_set ^= lowest
+            vertices.append(lowest.bit_length() - 1)
+        return tuple(vertices)
+
+    def deterministic_classes(self):
+        strategies = list(DETERMINISTIC_STRATEGIES)
+        if self.graph.number_of_nodes() < 500:
+            strategies.append(
+                nx.coloring.strategy_independent_set,
+            )  # This strategy is extremely slow on huge graphs
+        graph = self.graph.to_networkx()  # Coloring strategies come from networkx
+        for strategy in strategies:
+            color_classes = {}
+            colors_dict = nx.coloring.greedy_color(graph, strategy=strategy)
+            for node, color in colors_dict.items():
+                color_classes[color] = color_classes.get(color, 0) | 1 << node
+            yield from color_classes.values()
+
+    def random_classes(self):
+        """
+        Sequential greedy coloring in a random vertex order
+        """
+        color_classes = []
+        for vertex in self.random_state.permutation(self.graph.number_of_nodes()):
+            row = self.int_rows[vertex]
+            for color, color_class in enumerate(color_classes):
+                if not color_class & row:
+                    color_classes[color] |= 1 << int(vertex)
+                    break
+            else:
+                color_classes.append(1 << int(vertex))
+        return color_classes
+
+    def collect(self, color_classes, found):
+        new_sets = []
+        for color_class in color_classes:
+            ind_set = self.to_tuple(self.extend(color_class))
+            if len(ind_set) > 2 and ind_set not in found:
+                found.add(ind_set)
+                new_sets.append(ind_set)
+        return new_sets
+
+    def generate(self, add_rows, get_bound):
+        """
+        add_rows adds independent sets to the model, get_bound solves its LP
+        relaxation. Returns all generated sets
+        """
+        if self.cache is not None:
+            independent_sets = self.cache.load(self.graph)
+            if independent_sets is not None:
+                logging.info(
+                    f"Loaded {len(independent_sets)} independent sets from the cache",
+                )
+                add_rows(independent_sets)
+                return independent_sets
+        start_time = time()
+        found = set()
+        independent_sets = self.collect(self.deterministic_classes(), found)
+        add_rows(independent_sets)
+        bound = get_bound()
+        rounds_without_improvement = 0
+        rounds_number = 0
+        while rounds_number < self.max_rounds:
+            if time() - start_time >= self.time_limit:
+                logging.info("Out of time for independent sets searching")
+                break
+            rounds_number += 1
+            new_sets = self.collect(self.random_classes(), found)
+            if new_sets:
+                add_rows(new_sets)
+                independent_sets.extend(new_sets)
+                previous_bound, bound = bound, get_bound()
+                improvement = (previous_bound - bound) / max(previous_bound, 1.0)
+            else:
+                improvement = 0.0
+            if improvement < self.min_bound_improvement:
+                rounds_without_improvement += 1
+                if rounds_without_improvement >= self.patience:
+                    break
+            else:
+                rounds_without_improvement = 0
+        logging.info(
+            f"Searched for independent sets during {rounds_number} random rounds, "
+            f"found {len(independent_sets)} sets, LP bound: {bound:.3f}",
+        )
+        if self.cache is not None:
+            self.cache.save(self.graph, independent_sets)
+        return independent_sets
@@ -1,12 +1,27 @@
 import json
 import logging
+import multiprocessing as mp
 import os
 import sys
 from datetime import datetime
+from time import sleep, time
 
-from bnb_max_clique import BnBCliqueSolver
-from heuristic import GreedyHeuristic
-from utils import check_clique, parse_args, read_graph, time_it
+from bnb_max_clique import BnBCliqueSolver, IterativeBnBCliqueSolver
+from checkpoint import Checkpointer, load_checkpoint
+from combinatorial_bnb import ColoringBnBCliqueSolver
+from decomposition import DecompositionCliqueSolver
+from heuristic import GreedyHeuristic, IteratedLocalSearchHeuristic
+from independent_sets import IndependentSetCache
+from parallel_bnb import ParallelBnBCliqueSolver
+from reduction import GraphReduction
+from tracing import SearchTracer
+from utils import (
+    check_clique,
+    get_clique_violation,
+    parse_args,
+    read_graph,
+    time_it,
+)
 
 
 def print_solution(solution_values, objective_value):
@@ -19,21 +34,212 @@ def print_solution(solution_values, objective_value):
     logging.info(logging_str)
 
 
-@time_it
-def process_single_graph(path, args, best_known_solution=None):
-    graph = read_graph(path)
-    solver = BnBCliqueSolver(graph, args.method, args.time_limit, debug=args.debug)
-    if args.use_heuristics:
-        logging.info("Using heuristics")
-        heuristic_solver = GreedyHeuristic(graph)
-        heuristic_solution, heuristic_objective_value = heuristic_solver()
-        is_clique = check_clique(graph, heuristic_solution)[0]
+def build_solver(graph, args, checkpoint=None, model_cache=None, time_limit=None):
+    """
+    time_limit is what is left of args.time_limit after the heuristics
+    """
+    if time_limit is None:
+        time_limit = args.time_limit
+    if args.method == "coloring":
+        return ColoringBnBCliqueSolver(graph, time_limit)
+    independent_sets_cache = None
+    if args.ind_sets_cache_dir:
+        independent_sets_cache = IndependentSetCache(
+            args.ind_sets_cache_dir, args.ind_sets_cache_size,
+        )
+    if args.decomposition and checkpoint is None:
+        return DecompositionCliqueSolver(
+            graph,
+            args.method,
+            time_limit,
+            debug=args.debug,
+            workers=args.workers,
+            lazy_constraints=args.cuts == "lazy",
+            coloring_bound=not args.disable_coloring_bound,
+            branching=args.branching,
+            rounding_frequency=args.rounding_frequency,
+            seed=args.seed,
+        )
+    if args.workers > 1 and checkpoint is None:
+        return ParallelBnBCliqueSolver(
+            graph,
+            args.method,
+            time_limit,
+            debug=args.debug,
+            workers=args.workers,
+            split_depth=args.split_depth,
+            node_selection=args.node_selection,
+            max_queue_memory_mb=args.max_queue_memory,
+            lazy_constraints=args.cuts == "lazy",
+            coloring_bound=not args.disable_coloring_bound,
+            independent_sets_cache=independent_sets_cache,
+            branching=args.branching,
+            rounding_frequency=args.rounding_frequency,
+            seed=args.seed,
+        )
+    independent_sets = None if checkpoint is None else checkpoint["independent_sets"]
+    problem = None
+    if model_cache is not None and checkpoint is None:
+        problem, independent_sets = model_cache.get(graph, args)
+    # Open nodes of a checkpoint can only be continued by the iterative engine
+    if (
+        args.engine == "iterative"
+        or args.node_selection != "dfs"
+        or checkpoint is not None
+    ):
+        return IterativeBnBCliqueSolver(
+            graph,
+            args.method,
+            time_limit,
+            debug=args.debug,
+            warm_start=args.warm_start,
+            node_selection=args.node_selection,
+            max_queue_memory_mb=args.max_queue_memory,
+            lazy_constraints=args.cuts == "lazy",
+            coloring_bound=not args.disable_coloring_bound,
+            independent_sets_cache=independent_sets_cache,
+            branching=args.branching,
+            rounding_frequency=args.rounding_frequency,
+            seed=args.seed,
+            independent_sets=independent_sets,
+            problem=problem,
+        )
+    return BnBCliqueSolver(
+        graph,
+        args.method,
+        time_limit,
+        debug=args.debug,
+        lazy_constraints=args.cuts == "lazy",
+        coloring_bound=not args.disable_coloring_bound,
+        independent_sets_cache=independent_sets_cache,
+        branching=args.branching,
+        rounding_frequency=args.rounding_frequency,
+        seed=args.seed,
+        independent_sets=independent_sets,
+        problem=problem,
+    )
+
+
+def run_heuristics(graph, args):
+    logging.info("Using heuristics")
+    heuristic_solver = GreedyHeuristic(graph, seed=args.seed)
+    heuristic_solution, heuristic_objective_value = heuristic_solver()
+    if args.ils_time_limit > 0:
         logging.info(
-            f"Finished with heuristics, found solution length: {heuristic_objective_value}, it's a clique: {is_clique}",
+            f"Greedy heuristics found solution length: {heuristic_objective_value}, running ILS",
+        )
+        heuristic_solver = IteratedLocalSearchHeuristic(
+            graph,
+            time_limit=min(args.ils_time_limit, args.time_limit),
+            initial_solution=heuristic_solution,
+            seed=args.seed,
+        )
+        heuristic_solution, heuristic_objective_value = heuristic_solver()
+    is_clique = check_clique(graph, heuristic_solution)[0]
+    logging.info(
+        f"Finished with heuristics, found solution length: {heuristic_objective_value}, it's a clique: {is_clique}",
+    )
+    if not is_clique:
+        return None, 0
+    return heuristic_solution, heuristic_objective_value
+
+
+def report_solution(graph, solution_values, objective_value, best_known_solution):
+    if solution_values is None:
+        logging.warning("No solution was found")
+        return False
+    print_solution(solution_values, objective_value)
+    is_clique, size_match_with_best_known = check_clique(
+        graph, solution_values, best_known_solution,
+    )
+    if is_clique:
+        logging.info("Found nodes create a clique")
+        if size_match_with_best_known:
+            logging.info("It's size matches with the best known")
+    else:
+        first, second = get_clique_violation(graph, solution_values)
+        logging.warning(
+            f"Found nodes don't form a clique! Vertices {first} and {second} aren't adjacent",
         )
-        if is_clique:
-            solver.set_objective_value(heuristic_objective_value)
+    return is_clique
+
+
+@time_it
+def process_single_graph(
+    path, args, best_known_solution=None, output_dir=None, graph=None, model_cache=None,
+):
+    """
+    graph and model_cache let the service reuse parsed graphs and built root models.
+    Time spent before the search (heuristics, reduction) counts in args.time_limit
+    """
+    start_time = time()
+    if graph is None:
+        graph = read_graph(path)
+    checkpoint = load_checkpoint(args.resume) if args.resume else None
+    heuristic_solution, heuristic_objective_value = None, 0
+    if args.use_heuristics and checkpoint is None:
+        heuristic_solution, heuristic_objective_value = run_heuristics(graph, args)
+    reduction = None
+    if checkpoint is not None:
+        if checkpoint["reduced_nodes"] is not None:
+            reduction = GraphReduction(
+                graph,
+                checkpoint["best_found_clique_size"],
+                nodes=checkpoint["reduced_nodes"],
+            )
+    elif heuristic_objective_value and not args.disable_reduction:
+        reduction = GraphReduction(graph, heuristic_objective_value)
+        if not reduction.graph.number_of_nodes():
+            logging.info("All vertices were reduced, the heuristic solution is optimal")
+            is_clique = report_solution(
+                graph,
+                heuristic_solution,
+                heuristic_objective_value,
+                best_known_solution,
+            )
+            return (
+                heuristic_objective_value,
+                is_clique,
+                False,
+                heuristic_objective_value,
+                0.0,
+                {},
+            )
+    solver = build_solver(
+        graph if reduction is None else reduction.graph,
+        args,
+        checkpoint,
+        model_cache,
+        time_limit=max(args.time_limit - (time() - start_time), 0),
+    )
+    if checkpoint is not None:
+        solver.resume(checkpoint)
+    elif heuristic_objective_value:
+        solver.set_objective_value(heuristic_objective_value)
+        if reduction is None:
             solver.set_solution(heuristic_solution)
+        elif reduction.restrict(heuristic_solution).sum() == heuristic_objective_value:
+            solver.set_solution(reduction.restrict(heuristic_solution))
+    # Workers of the parallel mode keep their open nodes to themselves
+    if (
+        output_dir is not None
+        and args.checkpoint_interval > 0
+        and isinstance(solver, BnBCliqueSolver)
+        and not isinstance(solver, ParallelBnBCliqueSolver)
+    ):
+        solver.checkpointer = Checkpointer(
+            get_checkpoint_path(output_dir, path),
+            args.checkpoint_interval,
+            reduced_nodes=None if reduction is None else reduction.nodes,
+        )
+    # Workers of the parallel mode are separate processes, only the main search is traced
+    if (
+        output_dir is not None
+        and args.trace is not None
+        and isinstance(solver, BnBCliqueSolver)
+        and not isinstance(solver, ParallelBnBCliqueSolver)
+    ):
+        solver.tracer = SearchTracer(args.trace, args.trace_sample_rate)
     time_limit_reached = False
     try:
         solver()
@@ -41,76 +247,210 @@ def process_single_graph(path, args, best_known_solution=None):
         logging.warning("Out of time!")
         time_limit_reached = True
     except Exception as msg:
-        logging.warning(msg)
+        logging.warning(f"Search failed, it is incomplete: {msg}")
     finally:
+        # The solver works with the reduced graph and keeps no solution if it didn't
+        # improve a heuristic one which was partially reduced
         solution_values = solver.get_solution()
+        if solution_values is None:
+            solution_values = heuristic_solution
+        elif reduction is not None:
+            solution_values = reduction.expand(solution_values)
         objective_value = solver.get_objective_value()
-        print_solution(solution_values, objective_value)
-        is_clique, size_match_with_best_known = check_clique(
-            solver.graph, solution_values, best_known_solution,
+        is_clique = report_solution(
+            graph, solution_values, objective_value, best_known_solution,
         )
-        if is_clique:
-            logging.info("Found nodes create a clique")
-            if size_match_with_best_known:
-                logging.info("It's size matches with the best known")
+        if getattr(solver, "tracer", None) is not None:
+            solver.tracer.export(output_dir, os.path.basename(path), solver.phase_times)
+        return (  # noqa:B012
+            objective_value,
+            is_clique,
+            time_limit_reached,
+            solver.get_best_bound(),
+            solver.get_gap(),
+            solver.get_search_statistics(),
+        )
+
+
+# Hard graphs are started first in batch mode
+DIFFICULTY_ORDER = {"H": 0, "M": 1, "E": 2}
+
+
+def setup_logging(args, log_path, prefix=""):
+    logging.basicConfig(
+        level=logging.INFO if not args.debug else logging.DEBUG,
+        format=f"%(asctime)s [%(levelname)s] {prefix}%(message)s",
+        handlers=[logging.FileHandler(log_path), logging.StreamHandler(sys.stdout)],
+    )
+
+
+def get_results_path(output_dir, path):
+    return os.path.join(output_dir, f"{os.path.basename(path)}.json")
+
+
+def get_checkpoint_path(output_dir, path):
+    return os.path.join(output_dir, f"{os.path.basename(path)}.checkpoint.npz")
+
+
+def has_results(output_dir, path):
+    """
+    Placeholders of crashed runs written by older sweeps have no answer, they are rerun
+    """
+    results_path = get_results_path(output_dir, path)
+    if not os.path.exists(results_path):
+        return False
+    with open(results_path, "r") as fp:
+        return json.load(fp).get("Found Answer") is not None
+
+
+def dump_graph_results(output_dir, path, graph_results):
+    with open(get_results_path(output_dir, path), "w") as fp:
+        json.dump(graph_results, fp, indent=4, sort_keys=False)
+
+
+def run_graph(
+    path,
+    args,
+    best_known_size=None,
+    difficult_level=None,
+    output_dir=None,
+    graph=None,
+    model_cache=None,
+):
+    logging.info(f"\n\nPROCESSING: {os.path.basename(path)}")
+    graph_results = {}
+    (
+        (
+            found_clique_size,
+            is_clique,
+            time_limit_reached,
+            best_bound,
+            gap,
+            search_statistics,
+        ),
+        processing_time,
+    ) = process_single_graph(
+        path,
+        args,
+        best_known_solution=int(best_known_size) if best_known_size else None,
+        output_dir=output_dir,
+        graph=graph,
+        model_cache=model_cache,
+    )
+    graph_results["Time (msec.)"] = processing_time
+    graph_results["Time (sec.)"] = processing_time / 1000
+    graph_results["Found Answer"] = found_clique_size
+    if best_known_size is not None:
+        graph_results["Best Known Answer"] = best_known_size
+        graph_results["Type"] = difficult_level
+    graph_results["Reached Time Limit"] = time_limit_reached
+    graph_results["Best Bound"] = best_bound
+    graph_results["Gap"] = gap
+    graph_results.update(search_statistics)
+    return graph_results
+
+
+def run_batch_graph(path, args, best_known_size, difficult_level, output_dir, log_path):
+    setup_logging(args, log_path, prefix=f"[{os.path.basename(path)}] ")
+    graph_results = run_graph(path, args, best_known_size, difficult_level, output_dir)
+    dump_graph_results(output_dir, path, graph_results)
+
+
+def expected_difficulty(graph_input):
+    path, _, difficult_level = graph_input
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return DIFFICULTY_ORDER.get(difficult_level, len(DIFFICULTY_ORDER)), -size
+
+
+def run_batch(inputs, args, output_dir, log_path):
+    """
+    Processes graph list. Graphs which already have results in output_dir are skipped,
+    so an interrupted sweep can be resumed. Crashed graphs get no results, so they are
+    retried by the next run. With a core budget larger than the number of
+    workers per graph, graphs are processed concurrently in separate processes,
+    the hardest ones first
+    """
+    pending = []
+    for graph_input in inputs:
+        if has_results(output_dir, graph_input[0]):
+            logging.info(f"Skipping {graph_input[0]}, results already exist")
         else:
-            logging.warning("Found nodes don't form a clique!")
-        return objective_value, is_clique, time_limit_reached  # noqa:B012
+            pending.append(graph_input)
+    concurrent_graphs = max(1, args.cores // args.workers)
+    if concurrent_graphs == 1:
+        for path, best_known_size, difficult_level in pending:
+            graph_results = run_graph(
+                path, args, best_known_size, difficult_level, output_dir,
+            )
+            dump_graph_results(output_dir, path, graph_results)
+        return
+    pending.sort(key=expected_difficulty)
+    logging.info(f"Processing {len(pending)} graphs, {concurrent_graphs} at once")
+    # Solvers must not be forked with cplex loaded. Graph processes aren't daemonic,
+    # as the parallel mode starts its own workers
+    context = mp.get_context("spawn")
+    running = {}
+    # Solvers stop on their own after the time limit, the grace period covers the
+    # setup and the final output
+    hard_time_limit = args.time_limit * 1.1 + 60
+    try:
+        while pending or running:
+            while pending and len(running) < concurrent_graphs:
+                path, best_known_size, difficult_level = pending.pop(0)
+                process = context.Process(
+                    target=run_batch_graph,
+                    args=(
+                        path,
+                        args,
+                        best_known_size,
+                        difficult_level,
+                        output_dir,
+                        log_path,
+                    ),
+                )
+                process.start()
+                running[process] = (path, time())
+            sleep(0.5)
+            for process, (path, start_time) in list(running.items()):
+                if process.is_alive() and time() - start_time < hard_time_limit:
+                    continue
+                if process.is_alive():
+                    logging.warning(f"{path} exceeded the time limit, terminating")
+                    process.terminate()
+                process.join()
+                del running[process]
+                if not os.path.exists(get_results_path(output_dir, path)):
+                    logging.warning(
+                        f"{path} finished without results after "
+                        f"{time() - start_time:.1f} secs (exit code {process.exitcode}), "
+                        f"it will be retried when the sweep is resumed",
+                    )
+    finally:
+        for process in running:
+            process.terminate()
+            process.join()
 
 
 @time_it
 def main():
     args = parse_args()
     start_time_formatted = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+    output_dir = args.output_dir or os.path.join("outputs", start_time_formatted)
+    log_path = f"logs/{start_time_formatted}.log"
     os.makedirs("logs", exist_ok=True)
-    os.makedirs(os.path.join("outputs", start_time_formatted), exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO if not args.debug else logging.DEBUG,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.FileHandler(f"logs/{start_time_formatted}.log"),
-            logging.StreamHandler(sys.stdout),
-        ],
-    )
+    os.makedirs(output_dir, exist_ok=True)
+    setup_logging(args, log_path)
     logging.info(f"Time Limit: {args.time_limit} secs")
     if ".txt" in args.path:
+        if args.resume:
+            logging.warning("--resume is only supported for single graphs, ignoring it")
+            args.resume = None
         with open(args.path, "r") as fp:
             inputs = [line.rstrip().split(",") for line in fp.readlines()[1:]]
-        for (path, best_known_size, difficult_level) in inputs:
-            filename = os.path.basename(path)
-            logging.info(f"\n\nPROCESSING: {os.path.basename(path)}")
-            graph_results = {}
-            (
-                (found_clique_size, is_clique, time_limit_reached),
-                processing_time,
-            ) = process_single_graph(
-                path, args, best_known_solution=int(best_known_size),
-            )
-            graph_results["Time (msec.)"] = processing_time
-            graph_results["Time (sec.)"] = processing_time / 1000
-            graph_results["Found Answer"] = found_clique_size
-            graph_results["Best Known Answer"] = best_known_size
-            graph_results["Type"] = difficult_level
-            graph_results["Reached Time Limit"] = time_limit_reached
-            with open(
-                os.path.join("outputs", start_time_formatted, f"{filename}.json"), "w",
-            ) as fp:
-                json.dump(graph_results, fp, indent=4, sort_keys=False)
+        run_batch(inputs, args, output_dir, log_path)
     else:
-        filename = os.path.basename(args.path)
-        graph_results = {}
-        (
-            (found_clique_size, is_clique, time_limit_reached),
-            processing_time,
-        ) = process_single_graph(args.path, args)
-        graph_results["Time (msec.)"] = processing_time
-        graph_results["Time (sec.)"] = processing_time / 1000
-        graph_results["Found Answer"] = found_clique_size
-        graph_results["Reached Time Limit"] = time_limit_reached
-        with open(
-            os.path.join("outputs", start_time_formatted, f"{filename}.json"), "w",
-        ) as fp:
-            json.dump(graph_results, fp, indent=4, sort_keys=False)
+        graph_results = run_graph(args.path, args, output_dir=output_dir)
+        dump_graph_results(output_dir, args.path, graph_results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+import heapq
+import logging
+from itertools import count
+
+NODE_SELECTION_STRATEGIES = ["dfs", "best", "hybrid"]
+
+
+def node_memory(node):
+    memory = node.fixed_variables.nbytes + node.fixed_values.nbytes
+    if node.basis is not None:
+        memory += sum(status.nbytes for status in node.basis)
+    return memory
+
+
+class OpenNodeQueue:
+    """
+    Open nodes of the iterative BnB.
+    dfs - LIFO stack only
+    best - priority queue keyed on the parent LP bound
+    hybrid - dives into the "1" branch and jumps to the best open node once the dive is pruned
+    When the queue exceeds its memory cap, new nodes go to the stack (DFS) until it's drained
+    """
+
+    def __init__(self, strategy="dfs", max_memory_mb=1024):
+        assert (
+            strategy in NODE_SELECTION_STRATEGIES
+        ), f"Node selection should be one of {NODE_SELECTION_STRATEGIES}"
+        self.strategy = strategy
+        self.max_memory = max_memory_mb * 1024 ** 2
+        self.memory = 0
+        self.stack = []
+        self.heap = []  # (-bound, -insertion order, node): ties go to the deepest node
+        self.order = count()
+        self.memory_cap_reached = False
+
+    def __len__(self):
+        return len(self.stack) + len(self.heap)
+
+    def push(self, node, dive=False):
+        cap_reached = self.memory > self.max_memory
+        if cap_reached and not self.memory_cap_reached:
+            logging.warning(
+                f"Open nodes take more than {self.max_memory / 1024 ** 2:.0f} MB, falling back to DFS",
+            )
+        self.memory_cap_reached = cap_reached
+        if (
+            self.strategy == "dfs"
+            or self.memory_cap_reached
+            or (self.strategy == "hybrid" and dive)
+        ):
+            self.stack.append(node)
+        else:
+            # Bases are too heavy to be kept for every open node
+            node = node._replace(basis=None)
+            heapq.heappush(self.heap, (-node.bound, -next(self.order), node))
+        self.memory += node_memory(node)
+
+    def keeps_bases(self):
+        """
+        Whether a "0" child pushed now keeps its basis, the heap drops them
+        """
+        return self.strategy == "dfs" or self.memory > self.max_memory
+
+    def push_children(self, zero_child, one_child):
+        self.push(zero_child)
+        self.push(one_child, dive=True)
+
+    def pop(self):
+        if self.stack:
+            node = self.stack.pop()
+        else:
+            node = heapq.heappop(self.heap)[2]
+        self.memory -= node_memory(node)
+        return node
+
+    def steal(self):
+        """
+        Takes a node to be explored by somebody else: the best node of the heap or the
+        shallowest node of the stack (the largest subtree)
+        """
+        if self.heap:
+            node = heapq.heappop(self.heap)[2]
+        else:
+            node = self.stack.pop(0)
+        self.memory -= node_memory(node)
+        return node
+
+    def nodes(self):
+        return self.stack + [entry[2] for entry in self.heap]
+
+    def best_bound(self):
+        bounds = [node.bound for node in self.stack]
+        if self.heap:
+            bounds.append(-self.heap[0][0])
+        return max(bounds) if bounds else None
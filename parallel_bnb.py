@@ -0,0 +1,357 @@
+import logging
+import multiprocessing as mp
+import queue
+from collections import deque
+from time import time
+
+from bnb_max_clique import IterativeBnBCliqueSolver
+
+# Workers build their own cplex models, forking a process with cplex loaded is unsafe
+SPAWN_CONTEXT = mp.get_context("spawn")
+
+
+def collect_results(processes, results):
+    reports = []
+    while len(reports) < len(processes):
+        try:
+            reports.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+    while True:  # Reports of the workers which exited during the last wait
+        try:
+            reports.append(results.get_nowait())
+        except queue.Empty:
+            break
+    return reports
+
+
+def run_pool(target, args, workers):
+    """
+    Runs workers processes of target(*args, results) and returns their reports,
+    workers which crashed don't have one
+    """
+    results = SPAWN_CONTEXT.Queue()
+    processes = [
+        SPAWN_CONTEXT.Process(target=target, args=(*args, results), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        return collect_results(processes, results)
+    finally:
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+
+def drain_queue(tasks):
+    """
+    Tasks nobody had time to take
+    """
+    remaining = []
+    while True:
+        try:
+            remaining.append(tasks.get_nowait())
+        except queue.Empty:
+            return remaining
+
+
+def check_reports(reports, workers):
+    """
+    Logs the errors of the workers, returns whether some of them failed
+    """
+    for report in reports:
+        if report["error"] is not None:
+            logging.warning(f"Worker failed: {report['error']}")
+    return len(reports) < workers or any(
+        report["error"] is not None for report in reports
+    )
+
+
+def get_best_report(reports, best_found_clique_size, solution_key):
+    """
+    Report of the worker with the largest incumbent if it's better than the given one
+    """
+    best_report = None
+    for report in reports:
+        if (
+            report.get(solution_key) is not None
+            and report["best_found_clique_size"] > best_found_clique_size
+        ):
+            best_found_clique_size = report["best_found_clique_size"]
+            best_report = report
+    return best_report
+
+
+def raise_for_reports(reports, failed):
+    if any(report["timed_out"] for report in reports):
+        raise TimeoutError
+    if failed:
+        raise RuntimeError("Some of the workers failed, the search is incomplete")
+
+
+class SharedSearchState:
+    """
+    State shared between the workers: incumbent size, subproblems queue, number of
+    subproblems which are queued or being explored and number of idle workers
+    """
+
+    def __init__(self, context, incumbent, pending):
+        self.incumbent = context.Value("d", incumbent)
+        self.pending = context.Value("i", pending)
+        self.idle = context.Value("i", 0)
+        self.tasks = context.Queue()
+
+
+class WorkerBnBCliqueSolver(IterativeBnBCliqueSolver):
+    """
+    Explores subproblems taken from the shared queue with its own model, built from the
+    independent sets of the parent. Prunes against the global incumbent and gives away
+    its shallowest open nodes to idle workers
+    """
+
+    def __init__(
+        self,
+        graph,
+        solve_type,
+        time_limit,
+        shared,
+        debug=False,
+        node_selection="dfs",
+        max_queue_memory_mb=1024,
+        lazy_constraints=False,
+        coloring_bound=True,
+        independent_sets_cache=None,
+        branching="closest_to_one",
+        rounding_frequency=100,
+        seed=None,
+        independent_sets=None,
+    ):
+        super().__init__(
+            graph,
+            solve_type,
+            time_limit,
+            debug=debug,
+            node_selection=node_selection,
+            max_queue_memory_mb=max_queue_memory_mb,
+            lazy_constraints=lazy_constraints,
+            coloring_bound=coloring_bound,
+            independent_sets_cache=independent_sets_cache,
+            branching=branching,
+            rounding_frequency=rounding_frequency,
+            seed=seed,
+            independent_sets=independent_sets,
+        )
+        self.shared = shared
+
+    def sync_incumbent(self):
+        incumbent = self.shared.incumbent
+        if incumbent.value > self.best_found_clique_size:
+            self.best_found_clique_size = incumbent.value
+            self.reduce_columns()
+        elif incumbent.value < self.best_found_clique_size:
+            with incumbent.get_lock():
+                incumbent.value = max(incumbent.value, self.best_found_clique_size)
+
+    def donate_nodes(self):
+        # Bases can't be shared, every worker has its own set of rows
+        for _ in range(min(self.shared.idle.value, len(self.open_nodes) - 1)):
+            with self.shared.pending.get_lock():
+                self.shared.pending.value += 1
+            self.shared.tasks.put(self.open_nodes.steal()._replace(basis=None))
+
+    def next_task(self):
+        try:
+            return self.shared.tasks.get_nowait()
+        except queue.Empty:
+            pass
+        with self.shared.idle.get_lock():
+            self.shared.idle.value += 1
+        try:
+            while True:
+                self.check_time()
+                try:
+                    return self.shared.tasks.get(timeout=0.05)
+                except queue.Empty:
+                    if self.shared.pending.value == 0:
+                        return None
+        finally:
+            with self.shared.idle.get_lock():
+                self.shared.idle.value -= 1
+
+    def solve(self):
+        while len(self.open_nodes):
+            self.current_node = None
+            self.check_time()
+            self.sync_incumbent()
+            self.donate_nodes()
+            self.current_node = self.open_nodes.pop()
+            children = self.process_node(self.current_node)
+            if children is not None:
+                self.open_nodes.push_children(*children)
+        self.current_node = None
+        self.sync_incumbent()
+        return 0
+
+    def run(self):
+        while True:
+            node = self.next_task()
+            if node is None:
+                return
+            self.open_nodes.push(node)
+            self.solve()
+            with self.shared.pending.get_lock():
+                self.shared.pending.value -= 1
+
+
+def run_worker(graph, solve_type, deadline, options, shared, results):
+    solver = None
+    report = {"timed_out": False, "error": None}
+    try:
+        solver = WorkerBnBCliqueSolver(
+            graph, solve_type, deadline - time(), shared, **options,
+        )
+        solver.run()
+    except TimeoutError:
+        report["timed_out"] = True
+    except Exception as msg:
+        report["error"] = str(msg)
+    if solver is not None:
+        report["best_found_clique_size"] = solver.best_found_clique_size
+        report["best_clique"] = solver.best_clique
+        report["best_found_time"] = solver.best_found_time
+        report["call_times"] = solver.call_times
+        report["open_nodes_bound"] = solver.get_open_nodes_bound()
+    results.put(report)
+
+
+class ParallelBnBCliqueSolver(IterativeBnBCliqueSolver):
+    """
+    Splits the top of the tree breadth-first into subproblems and explores them with a
+    pool of worker processes sharing the incumbent
+    """
+
+    def __init__(
+        self,
+        graph,
+        solve_type,
+        time_limit,
+        debug=False,
+        workers=2,
+        split_depth=8,
+        subproblems_per_worker=4,
+        node_selection="dfs",
+        max_queue_memory_mb=1024,
+        lazy_constraints=False,
+        coloring_bound=True,
+        independent_sets_cache=None,
+        branching="closest_to_one",
+        rounding_frequency=100,
+        seed=None,
+    ):
+        super().__init__(
+            graph,
+            solve_type,
+            time_limit,
+            debug=debug,
+            node_selection=node_selection,
+            max_queue_memory_mb=max_queue_memory_mb,
+            lazy_constraints=lazy_constraints,
+            coloring_bound=coloring_bound,
+            independent_sets_cache=independent_sets_cache,
+            branching=branching,
+            rounding_frequency=rounding_frequency,
+            seed=seed,
+        )
+        self.workers = workers
+        self.split_depth = split_depth
+        self.subproblems_per_worker = subproblems_per_worker
+        self.worker_options = {
+            "debug": debug,
+            "node_selection": node_selection,
+            "max_queue_memory_mb": max_queue_memory_mb,
+            "lazy_constraints": lazy_constraints,
+            "coloring_bound": coloring_bound,
+            "independent_sets_cache": independent_sets_cache,
+            "branching": branching,
+            "rounding_frequency": rounding_frequency,
+            "seed": seed,
+            # Workers build the same model as the one the tree was split on
+            "independent_sets": self.independent_sets,
+        }
+        self.workers_open_nodes_bound = None
+
+    def split(self):
+        frontier = deque([self.root_node()])
+        subproblems_number = self.workers * self.subproblems_per_worker
+        try:
+            while (
+                frontier
+                and len(frontier) < subproblems_number
+                and frontier[0].depth < self.split_depth
+            ):
+                self.current_node = None
+                self.check_time()
+                self.current_node = frontier.popleft()
+                children = self.process_node(self.current_node)
+                if children is not None:
+                    frontier.extend(children)
+        except TimeoutError:
+            for node in frontier:  # Keep them for the best bound
+                self.open_nodes.push(node)
+            raise
+        self.current_node = None
+        return [node._replace(basis=None) for node in frontier]
+
+    def merge_reports(self, reports, shared):
+        open_bounds = []
+        for report in reports:
+            if "call_times" not in report:
+                continue
+            self.call_times += report["call_times"]
+            if report["open_nodes_bound"] is not None:
+                open_bounds.append(report["open_nodes_bound"])
+        best_report = get_best_report(
+            reports, self.best_found_clique_size, "best_clique",
+        )
+        if best_report is not None:
+            self.best_found_clique_size = best_report["best_found_clique_size"]
+            self.best_clique = best_report["best_clique"]
+            self.best_found_time = best_report["best_found_time"]
+        open_bounds.extend(node.bound for node in drain_queue(shared.tasks))
+        failed = check_reports(reports, self.workers)
+        if failed and self.root_bound is not None:
+            # Subproblems of the failed workers are lost, only the root bound is valid
+            open_bounds.append(self.root_bound)
+        self.workers_open_nodes_bound = max(open_bounds) if open_bounds else None
+        return failed
+
+    def get_open_nodes_bound(self):
+        bounds = [super().get_open_nodes_bound(), self.workers_open_nodes_bound]
+        bounds = [bound for bound in bounds if bound is not None]
+        return max(bounds) if bounds else None
+
+    def solve(self):
+        deadline = self.timer + self.time_limit
+        subproblems = self.split()
+        if not subproblems:
+            return 0
+        logging.info(
+            f"Split the tree into {len(subproblems)} subproblems, starting {self.workers} workers",
+        )
+        shared = SharedSearchState(
+            SPAWN_CONTEXT, self.best_found_clique_size, len(subproblems),
+        )
+        for node in subproblems:
+            shared.tasks.put(node)
+        reports = run_pool(
+            run_worker,
+            (self.graph, self.solve_type, deadline, self.worker_options, shared),
+            self.workers,
+        )
+        failed = self.merge_reports(reports, shared)
+        raise_for_reports(reports, failed)
+        return 0
@@ -0,0 +1,68 @@
+import logging
+
+import numpy as np
+
+
+def peel_vertices(graph, lower_bound, alive=None):
+    """
+    Iteratively removes vertices with degree + 1 <= lower_bound inside the alive set
+    (k-core peeling): they can't belong to a clique larger than lower_bound.
+    Returns the new alive mask
+    """
+    num_nodes = graph.number_of_nodes()
+    alive = np.ones(num_nodes, dtype=bool) if alive is None else alive.copy()
+    degrees = graph.count_in(graph.to_mask(alive))
+    while True:
+        removed = alive & (degrees + 1 <= lower_bound)
+        if not removed.any():
+            return alive
+        alive &= ~removed
+        degrees -= graph.count_in(graph.to_mask(removed))
+
+
+def count_vertices_and_rows(graph, alive):
+    """
+    Number of alive vertices and of complement edges between them (edge constraints
+    before independent sets cover some of them)
+    """
+    alive_number = int(alive.sum())
+    alive_nodes = np.flatnonzero(alive)
+    edges_number = int(graph.count_in(graph.to_mask(alive), alive_nodes).sum())
+    return alive_number, alive_number * (alive_number - 1) // 2 - edges_number // 2
+
+
+def log_reduction(graph, alive_before, alive_after, lower_bound):
+    vertices_before, rows_before = count_vertices_and_rows(graph, alive_before)
+    vertices_after, rows_after = count_vertices_and_rows(graph, alive_after)
+    logging.info(
+        f"Reduction with incumbent {lower_bound}: vertices {vertices_before} -> {vertices_after}, "
+        f"edge rows {rows_before} -> {rows_after}",
+    )
+
+
+class GraphReduction:
+    """
+    Graph without vertices which can't be in a clique larger than lower_bound, vertices
+    are relabelled to 0..n' - 1. nodes maps reduced ids to the original ones, they can
+    be given to restore a previous reduction
+    """
+
+    def __init__(self, graph, lower_bound, nodes=None):
+        self.original_graph = graph
+        self.lower_bound = lower_bound
+        if nodes is None:
+            alive = peel_vertices(graph, lower_bound)
+            log_reduction(
+                graph, np.ones(graph.number_of_nodes(), dtype=bool), alive, lower_bound,
+            )
+            nodes = np.flatnonzero(alive)
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.graph = graph.subgraph(self.nodes)
+
+    def expand(self, solution):
+        original_solution = np.zeros(self.original_graph.number_of_nodes())
+        original_solution[self.nodes] = solution
+        return original_solution
+
+    def restrict(self, solution):
+        return np.asarray(solution)[self.nodes]
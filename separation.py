@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class IndependentSetSeparator:
+    """
+    Greedy separation of independent set inequalities sum_{i in S} x_i <= 1.
+    Every vertex of the LP support (by decreasing value) seeds an independent set,
+    which is grown with the largest-valued non-adjacent vertices and, if it's violated,
+    extended to a maximal one with zero-valued vertices
+    """
+
+    def __init__(self, graph, epsilon=1e-3, max_cuts=50):
+        self.non_adjacency = graph.complement().to_dense()
+        self.epsilon = epsilon
+        self.max_cuts = max_cuts
+
+    def grow(self, candidates, ind_set, non_adjacency):
+        candidates = candidates.copy()
+        while candidates.any():
+            position = int(np.argmax(candidates))
+            ind_set.append(position)
+            candidates &= non_adjacency[position]
+        return ind_set
+
+    def separate(self, solution):
+        solution = np.asarray(solution)
+        support = np.flatnonzero(solution > self.epsilon)
+        support = support[np.argsort(-solution[support], kind="stable")]
+        values = solution[support]
+        # Positions in the support are sorted by value, so the first candidate is
+        # always the largest-valued one
+        support_non_adjacency = self.non_adjacency[np.ix_(support, support)]
+        cuts = []
+        found = set()
+        for seed in range(len(support)):
+            ind_set = self.grow(
+                support_non_adjacency[seed], [seed], support_non_adjacency,
+            )
+            if values[ind_set].sum() <= 1 + self.epsilon:
+                continue
+            ind_set = support[ind_set].tolist()
+            candidates = np.bitwise_and.reduce(self.non_adjacency[ind_set], axis=0)
+            ind_set = self.grow(candidates, ind_set, self.non_adjacency)
+            key = tuple(sorted(ind_set))
+            if key in found:
+                continue
+            found.add(key)
+            cuts.append(list(key))
+            if len(cuts) >= self.max_cuts:
+                break
+        return cuts
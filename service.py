@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+from argparse import ArgumentParser
+from collections import OrderedDict
+from datetime import datetime
+from time import time
+
+import cplex
+
+from bnb_max_clique import CliqueSolver
+from independent_sets import IndependentSetCache
+from main import run_graph, setup_logging
+from utils import parse_args, read_graph
+
+
+class GraphCache:
+    """
+    LRU cache of parsed graphs keyed by the path, a graph is re-read if its file changed
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.graphs = OrderedDict()
+
+    def get(self, path):
+        """
+        Returns the graph and whether it was cached
+        """
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        entry = self.graphs.pop(key, None)
+        hit = entry is not None and entry[0] == version
+        if not hit:
+            entry = (version, read_graph(path))
+        self.graphs[key] = entry
+        while len(self.graphs) > self.max_entries:
+            self.graphs.popitem(last=False)
+        return entry[1], hit
+
+
+class ModelCache:
+    """
+    LRU cache of root models (LP/ILP with the independent set and edge rows) keyed by
+    the graph hash, the method, the cuts mode and the seed. Every job gets a copy of the root,
+    so branching rows and cuts don't leak between jobs. Independent sets are generated
+    once with the time limit of the first job
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.models = OrderedDict()
+        self.hit = None
+        self.setup_time = 0.0
+
+    def get(self, graph, args):
+        start_time = time()
+        key = (graph.content_hash(), args.method, args.cuts, args.seed)
+        entry = self.models.pop(key, None)
+        self.hit = entry is not None
+        if entry is None:
+            independent_sets_cache = None
+            if args.ind_sets_cache_dir:
+                independent_sets_cache = IndependentSetCache(
+                    args.ind_sets_cache_dir, args.ind_sets_cache_size,
+                )
+            root = CliqueSolver(
+                graph,
+                args.method,
+                args.time_limit,
+                debug=args.debug,
+                lazy_constraints=args.cuts == "lazy",
+                independent_sets_cache=independent_sets_cache,
+                seed=args.seed,
+            )
+            entry = (root.problem, root.independent_sets)
+        self.models[key] = entry
+        while len(self.models) > self.max_entries:
+            self.models.popitem(last=False)
+        problem = cplex.Cplex(entry[0])
+        self.setup_time += time() - start_time
+        logging.info(
+            f"{'Copied cached' if self.hit else 'Built'} root model in {time() - start_time:.3f} secs",
+        )
+        return problem, list(entry[1])
+
+
+def job_to_argv(job):
+    """
+    Job fields are translated into main.py arguments, "args" holds any other ones
+    """
+    argv = ["-p", job["path"]]
+    if "method" in job:
+        argv.extend(["-m", job["method"]])
+    if "time_limit" in job:
+        argv.extend(["-t", str(job["time_limit"])])
+    if job.get("use_heuristics"):
+        argv.append("-uh")
+    return argv + list(job.get("args", []))
+
+
+class SolverService:
+    def __init__(self, graph_cache_size=16, model_cache_size=4):
+        self.graph_cache = GraphCache(graph_cache_size)
+        self.model_cache = ModelCache(model_cache_size)
+        self.jobs_number = 0
+
+    def run_job(self, job):
+        """
+        Returns the results JSON of main.py plus setup and solve times of the job
+        """
+        args = parse_args(job_to_argv(job))
+        if ".txt" in args.path:
+            raise ValueError("Only single graphs can be solved by the service")
+        self.jobs_number += 1
+        logging.info(f"\n\nJOB {self.jobs_number}: {job}")
+        start_time = time()
+        graph, graph_hit = self.graph_cache.get(args.path)
+        graph_time = time() - start_time
+        self.model_cache.setup_time = 0.0
+        self.model_cache.hit = None
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        graph_results = run_graph(
+            args.path,
+            args,
+            best_known_size=job.get("best_known_size"),
+            output_dir=args.output_dir,
+            graph=graph,
+            model_cache=self.model_cache,
+        )
+        setup_time = graph_time + self.model_cache.setup_time
+        graph_results["Setup Time (sec.)"] = setup_time
+        graph_results["Solve Time (sec.)"] = (
+            graph_results["Time (sec.)"] - self.model_cache.setup_time
+        )
+        graph_results["Graph Cache Hit"] = graph_hit
+        graph_results["Model Cache Hit"] = self.model_cache.hit
+        logging.info(
+            f"Job {self.jobs_number} finished, setup: {setup_time:.3f} secs, "
+            f"solve: {graph_results['Solve Time (sec.)']:.3f} secs",
+        )
+        return graph_results
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Every line is a JSON job, every result is sent back as a JSON line
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                result = self.server.service.run_job(json.loads(line))
+            except SystemExit:  # argparse exits on bad arguments
+                logging.warning(f"Invalid job arguments: {line!r}")
+                result = {"error": "Invalid job arguments"}
+            except Exception as msg:
+                logging.warning(f"Job failed: {msg}")
+                result = {"error": str(msg)}
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+
+class JobServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        super().__init__(address, JobHandler)
+        self.service = service
+
+
+def submit(jobs, host="127.0.0.1", port=8765):
+    """
+    Sends jobs over one connection and yields their results as they are finished
+    """
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile("rw") as stream:
+            for job in jobs:
+                stream.write(json.dumps(job) + "\n")
+            stream.flush()
+            connection.shutdown(socket.SHUT_WR)
+            for line in stream:
+                yield json.loads(line)
+
+
+def parse_service_args(argv=None):
+    parser = ArgumentParser(
+        description="Keeps parsed graphs and root models warm between solve jobs",
+    )
+    parser.add_argument("command", choices=["serve", "submit"])
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--graph_cache_size", type=int, default=16, help="Parsed graphs to keep",
+    )
+    parser.add_argument(
+        "--model_cache_size", type=int, default=4, help="Root models to keep",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=str,
+        default=None,
+        help="File with JSON jobs (one per line) to submit, stdin by default",
+    )
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="Allow debug prints",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    service_args = parse_service_args(argv)
+    if service_args.command == "submit":
+        with open(service_args.jobs, "r") if service_args.jobs else sys.stdin as fp:
+            jobs = [json.loads(line) for line in fp if line.strip()]
+        for result in submit(jobs, service_args.host, service_args.port):
+            print(json.dumps(result, indent=4))
+        return
+    os.makedirs("logs", exist_ok=True)
+    log_path = f"logs/service_{datetime.now().strftime('%d-%m-%Y_%H-%M-%S')}.log"
+    setup_logging(service_args, log_path)
+    service = SolverService(
+        service_args.graph_cache_size, service_args.model_cache_size,
+    )
+    with JobServer((service_args.host, service_args.port), service) as server:
+        logging.info(f"Serving on {service_args.host}:{service_args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info(f"Stopped after {service.jobs_number} jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import json
+import logging
+import math
+import os
+from collections import defaultdict
+from functools import wraps
+from time import perf_counter, time
+
+import numpy as np
+
+PRUNE_REASONS = ["branched", "bound", "coloring", "reduced", "infeasible", "integral"]
+TRACE_FORMATS = ["json", "csv"]
+# LP latency histogram: 4 log-spaced bins per decade from 10 us to 100 s
+LATENCY_BINS_PER_DECADE = 4
+LATENCY_MIN_EXPONENT = -5
+LATENCY_BINS_NUMBER = 7 * LATENCY_BINS_PER_DECADE
+
+
+class SearchTracer:
+    """
+    Instrumentation of the BnB: time per phase, LP latency histogram, prune reasons and
+    incumbent updates for every node, and depth, LP time, bound, prune reason and
+    search state memory of every sample_rate-th node in preallocated ring buffers (the
+    last capacity samples are kept)
+    """
+
+    def __init__(self, trace_format="json", sample_rate=10, capacity=100000):
+        assert (
+            trace_format in TRACE_FORMATS
+        ), f"Trace format should be one of {TRACE_FORMATS}"
+        self.trace_format = trace_format
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.start_time = time()
+        self.node_ids = np.zeros(capacity, dtype=np.int64)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.depths = np.zeros(capacity, dtype=np.int32)
+        self.lp_times = np.zeros(capacity, dtype=np.float64)
+        self.bounds = np.zeros(capacity, dtype=np.float64)
+        self.reasons = np.zeros(capacity, dtype=np.int8)
+        self.memories = np.zeros(capacity, dtype=np.int64)
+        self.samples_number = 0
+        self.nodes_number = 0
+        self.node_lp_time = 0.0
+        self.max_depth = 0
+        self.phase_times = defaultdict(float)
+        # Time of the phases nested in the running ones, it isn't counted twice
+        self.nested_times = []
+        self.reason_counts = np.zeros(len(PRUNE_REASONS), dtype=np.int64)
+        self.latency_counts = np.zeros(LATENCY_BINS_NUMBER, dtype=np.int64)
+        self.incumbent_updates = []
+        self.overhead = 0.0
+        self.max_memory = 0
+
+    def enter_phase(self):
+        self.nested_times.append(0.0)
+
+    def exit_phase(self, phase, seconds):
+        """
+        Phases are exclusive: a nested phase is subtracted from the enclosing one
+        """
+        self.add_time(phase, seconds - self.nested_times.pop())
+
+    def add_time(self, phase, seconds):
+        self.phase_times[phase] += seconds
+        if self.nested_times:
+            self.nested_times[-1] += seconds
+
+    def record_lp(self, seconds):
+        self.add_time("lp_solve", seconds)
+        self.node_lp_time += seconds
+        if seconds > 0:
+            idx = int((math.log10(seconds) - LATENCY_MIN_EXPONENT) * LATENCY_BINS_PER_DECADE)
+            self.latency_counts[min(max(idx, 0), LATENCY_BINS_NUMBER - 1)] += 1
+
+    def record_node(self, depth, bound, reason, get_memory=None):
+        """
+        get_memory returns bytes of the search state, it's only called for samples
+        """
+        start = perf_counter()
+        reason_idx = PRUNE_REASONS.index(reason)
+        self.nodes_number += 1
+        self.reason_counts[reason_idx] += 1
+        self.max_depth = max(self.max_depth, depth)
+        if self.nodes_number % self.sample_rate == 0:
+            position = self.samples_number % self.capacity
+            self.node_ids[position] = self.nodes_number
+            self.timestamps[position] = time() - self.start_time
+            self.depths[position] = depth
+            self.lp_times[position] = self.node_lp_time
+            self.bounds[position] = np.nan if bound is None else bound
+            self.reasons[position] = reason_idx
+            self.memories[position] = 0 if get_memory is None else get_memory()
+            self.max_memory = max(self.max_memory, int(self.memories[position]))
+            self.samples_number += 1
+        self.node_lp_time = 0.0
+        self.overhead += perf_counter() - start
+
+    def record_incumbent(self, size):
+        self.incumbent_updates.append(
+            {
+                "time": time() - self.start_time,
+                "node": self.nodes_number,
+                "size": float(size),
+            },
+        )
+
+    def get_samples(self):
+        """
+        Sampled records in chronological order
+        """
+        size = min(self.samples_number, self.capacity)
+        order = np.arange(size)
+        if self.samples_number > self.capacity:
+            order = (order + self.samples_number) % self.capacity
+        return {
+            "node": self.node_ids[order],
+            "time": self.timestamps[order],
+            "depth": self.depths[order],
+            "lp_time": self.lp_times[order],
+            "bound": self.bounds[order],
+            "reason": np.array(PRUNE_REASONS)[self.reasons[order]],
+            "memory_bytes": self.memories[order],
+        }
+
+    def get_latency_histogram(self):
+        edges = 10.0 ** (
+            LATENCY_MIN_EXPONENT
+            + np.arange(LATENCY_BINS_NUMBER + 1) / LATENCY_BINS_PER_DECADE
+        )
+        return {
+            "bin_edges_ms": (edges * 1000).tolist(),
+            "counts": self.latency_counts.tolist(),
+        }
+
+    def get_summary(self, setup_phase_times=None):
+        """
+        Setup phases (model construction, independent sets) happen before the search,
+        shares of the search phases are taken of the search time
+        """
+        total_time = time() - self.start_time
+        setup_phases = dict(setup_phase_times or {})
+        phases = dict(self.phase_times)
+        phases["tracing_overhead"] = self.overhead
+        return {
+            "setup_time": sum(setup_phases.values()),
+            "setup_phase_times": setup_phases,
+            "search_time": total_time,
+            "nodes": self.nodes_number,
+            "sampled_nodes": self.samples_number,
+            "sample_rate": self.sample_rate,
+            "max_depth": self.max_depth,
+            "max_sampled_memory_bytes": self.max_memory,
+            "phase_times": phases,
+            "phase_shares": {
+                phase: seconds / total_time if total_time > 0 else 0.0
+                for phase, seconds in phases.items()
+            },
+            "prune_reasons": dict(zip(PRUNE_REASONS, self.reason_counts.tolist())),
+            "lp_latency_histogram": self.get_latency_histogram(),
+            "incumbent_updates": self.incumbent_updates,
+        }
+
+    def export(self, output_dir, name, setup_phase_times=None):
+        summary = self.get_summary(setup_phase_times)
+        samples = self.get_samples()
+        base_path = os.path.join(output_dir, f"{name}.trace")
+        if self.trace_format == "json":
+            summary["samples"] = {key: value.tolist() for key, value in samples.items()}
+            # Nodes pruned before their LP have no bound, NaN isn't valid JSON
+            summary["samples"]["bound"] = [
+                None if math.isnan(bound) else bound
+                for bound in summary["samples"]["bound"]
+            ]
+            paths = [f"{base_path}.json"]
+            with open(paths[0], "w") as fp:
+                json.dump(summary, fp, indent=4)
+        else:
+            paths = [f"{base_path}.csv", f"{base_path}_summary.json"]
+            with open(paths[0], "w") as fp:
+                fp.write(",".join(samples) + "\n")
+                for row in zip(*(value.tolist() for value in samples.values())):
+                    fp.write(",".join(str(value) for value in row) + "\n")
+            with open(paths[1], "w") as fp:
+                json.dump(summary, fp, indent=4)
+        logging.info(
+            f"Trace of {self.nodes_number} nodes ({self.samples_number} sampled) written to "
+            f"{', '.join(paths)}, tracing overhead: {self.overhead:.3f} secs",
+        )
+
+
+def traced(phase):
+    """
+    Adds the running time of a solver method to the phase, if the solver has a tracer.
+    Time of the phases it calls is left to them
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrap(self, *args, **kwargs):
+            if self.tracer is None:
+                return method(self, *args, **kwargs)
+            self.tracer.enter_phase()
+            start = perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.tracer.exit_phase(phase, perf_counter() - start)
+
+        return wrap
+
+    return decorator
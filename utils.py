@@ -1,34 +1,126 @@
+import hashlib
 import logging
+import os
+import re
 import time
 from argparse import ArgumentParser
+from collections import defaultdict
+from contextlib import contextmanager
+from math import floor
 
-import networkx as nx
 import numpy as np
 
+from bitset_graph import BitsetGraph
+from branching import BRANCHING_POLICIES
+from tracing import TRACE_FORMATS
 
-def read_graph(path):
-    with open(path, "r") as fp:
-        for line in fp:
-            if line.startswith("p"):
-                _, name, vertices_num, edges_num = line.split()
-                adjacency_matrix = np.zeros(
-                    (int(vertices_num), (int(vertices_num))), dtype=np.bool,
-                )
-            elif line.startswith("e"):
-                _, v1, v2 = line.split()
-                adjacency_matrix[int(v1) - 1, int(v2) - 1] = 1
-            else:
-                continue
-    # np.fill_diagonal(adjacency_matrix, 1)
-    graph = nx.convert_matrix.from_numpy_matrix(adjacency_matrix)
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def parse_dimacs(content):
+    """
+    Parses .clq content into an int32 array: the first row is (vertices number, edges
+    number), the rest are 0-based edges
+    """
+    header = re.search(rb"^p\s+\S+\s+(\d+)\s+(\d+)", content, flags=re.M)
+    if header is None:
+        raise ValueError("DIMACS problem line is missing")
+    # Everything except edge lines is dropped (newlines are kept, so a blank line
+    # doesn't swallow the next one), then all numbers are parsed at once
+    edge_lines = re.sub(rb"^[^e\n].*$", b"", content, flags=re.M).replace(b"e", b" ")
+    if edge_lines.strip():
+        edges = np.fromstring(edge_lines.decode("ascii"), dtype=np.int32, sep=" ")
+    else:
+        edges = np.empty(0, dtype=np.int32)
+    if len(edges) % 2:
+        raise ValueError("Malformed edge line")
+    if len(edges) // 2 != int(header.group(2)):
+        # Some public files declare another count, the edge lines are kept
+        logging.warning(
+            f"DIMACS problem line declares {int(header.group(2))} edges, found {len(edges) // 2}",
+        )
+    graph_data = np.empty((len(edges) // 2 + 1, 2), dtype=np.int32)
+    graph_data[0] = int(header.group(1)), len(edges) // 2
+    graph_data[1:] = edges.reshape(-1, 2) - 1
+    return graph_data
+
+
+def read_graph(path, use_cache=True):
+    """
+    Reads DIMACS graph. Parsed graphs are cached next to the input as .npy files keyed
+    by the content hash, so repeat runs only hash the file and memory-map the edges
+    """
+    start_time = time.time()
+    with open(path, "rb") as fp:
+        content = fp.read()
+    cache_path = f"{path}.{hashlib.sha1(content).hexdigest()[:16]}.npy"
+    source = "cache"
+    if use_cache and os.path.exists(cache_path):
+        graph_data = np.load(cache_path, mmap_mode="r")
+    else:
+        source = "text"
+        graph_data = parse_dimacs(content)
+        if use_cache:
+            try:
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as fp:
+                    np.save(fp, graph_data)
+                os.replace(tmp_path, cache_path)
+            except OSError as msg:
+                logging.warning(f"Failed to cache the graph: {msg}")
+    graph = BitsetGraph.from_edges(int(graph_data[0, 0]), graph_data[1:])
+    logging.info(
+        f"Loaded {os.path.basename(path)} ({graph.number_of_nodes()} vertices, {len(graph_data) - 1} edges) "
+        f"from {source} in {time.time() - start_time:.3f} secs",
+    )
     return graph
 
 
-def cartesian_product(x, y):
-    return np.dstack(np.meshgrid(x, y)).reshape(-1, 2)
+def pair_keys(first, second, num_nodes):
+    """
+    Encodes unordered vertex pairs as sorted linear keys min * num_nodes + max
+    """
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    return np.unique(
+        np.minimum(first, second) * num_nodes + np.maximum(first, second),
+    )
+
+
+def complement_pair_keys(graph):
+    num_nodes = graph.number_of_nodes()
+    not_connected = graph.complement().edges
+    return pair_keys(not_connected[:, 0], not_connected[:, 1], num_nodes)
 
 
-def parse_args():
+def independent_sets_pair_keys(independent_sets, num_nodes):
+    """
+    Keys of all vertex pairs covered by independent sets. Sets of the same size are
+    stacked, so pairs are generated with one fancy indexing per size
+    """
+    sets_by_size = defaultdict(list)
+    for ind_set in independent_sets:
+        sets_by_size[len(ind_set)].append(ind_set)
+    keys = [np.empty(0, dtype=np.int64)]
+    for size, sets in sets_by_size.items():
+        sets = np.asarray(sets, dtype=np.int64)
+        first, second = np.triu_indices(size, 1)
+        keys.append(
+            pair_keys(sets[:, first].ravel(), sets[:, second].ravel(), num_nodes),
+        )
+    return np.unique(np.concatenate(keys))
+
+
+def get_peak_memory_mb():
+    if resource is None:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def parse_args(argv=None):
     parser = ArgumentParser(description="Finds max clique for DIMACS graphs")
     parser.add_argument(
         "-p",
@@ -41,9 +133,9 @@ def parse_args():
         "-m",
         "--method",
         type=str,
-        choices=["LP", "ILP"],
+        choices=["LP", "ILP", "coloring"],
         default="LP",
-        help="Treat the problem as LP or ILP",
+        help="Treat the problem as LP or ILP, or use the CPLEX-free coloring BnB",
     )
 
     parser.add_argument(
@@ -52,6 +144,22 @@ def parse_args():
         action="store_true",
         help="Use heuristics (ILS-based) to generate an initial solution",
     )
+    parser.add_argument(
+        "--ils_time_limit",
+        type=float,
+        default=10,
+        help="Time budget of the ILS heuristic run after the greedy ones (in secs), 0 disables it",
+    )
+    parser.add_argument(
+        "--disable_reduction",
+        action="store_true",
+        help="Don't remove vertices which can't be in a clique larger than the incumbent",
+    )
+    parser.add_argument(
+        "--disable_coloring_bound",
+        action="store_true",
+        help="Don't prune BnB nodes by the greedy coloring bound before solving the LP",
+    )
     parser.add_argument(
         "-t",
         "--time_limit",
@@ -59,11 +167,138 @@ def parse_args():
         default=3600,
         help="Time limit for processing the graph (in secs)",
     )
+    parser.add_argument(
+        "--ind_sets_cache_dir",
+        type=str,
+        default="cache/independent_sets",
+        help="Directory of the independent sets cache, empty string disables it",
+    )
+    parser.add_argument(
+        "--ind_sets_cache_size",
+        type=int,
+        default=64,
+        help="Max number of graphs in the independent sets cache (LRU eviction)",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=["recursive", "iterative"],
+        default="recursive",
+        help="BnB engine: recursive with branching rows or iterative with bound changes",
+    )
+    parser.add_argument(
+        "--warm_start",
+        action="store_true",
+        help="Iterative engine: restore the parent basis of nodes which aren't solved right after their parent",
+    )
+    parser.add_argument(
+        "--cuts",
+        type=str,
+        choices=["full", "lazy"],
+        default="full",
+        help="Build all edge constraints up front or separate violated independent set inequalities on demand",
+    )
+    parser.add_argument(
+        "--decomposition",
+        action="store_true",
+        help="Solve a small BnB per vertex neighborhood of the degeneracy order "
+        "(with --workers > 1 in a process pool)",
+    )
+    parser.add_argument(
+        "--branching",
+        type=str,
+        choices=list(BRANCHING_POLICIES),
+        default="closest_to_one",
+        help="Branching variable policy of the LP BnB",
+    )
+    parser.add_argument(
+        "--rounding_frequency",
+        type=int,
+        default=100,
+        help="Run the LP rounding heuristic every k BnB nodes, 0 disables it",
+    )
+    parser.add_argument(
+        "-ns",
+        "--node_selection",
+        type=str,
+        choices=["dfs", "best", "hybrid"],
+        default="dfs",
+        help="Node selection of the iterative engine: depth-first, best-bound or dive + best-bound jumps",
+    )
+    parser.add_argument(
+        "--max_queue_memory",
+        type=int,
+        default=1024,
+        help="Memory cap for open nodes (in MB), the search falls back to DFS when it's reached",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes exploring the BnB tree in parallel",
+    )
+    parser.add_argument(
+        "--split_depth",
+        type=int,
+        default=8,
+        help="Max depth at which the tree is split into subproblems for the workers",
+    )
+    parser.add_argument(
+        "-c",
+        "--cores",
+        type=int,
+        default=1,
+        help="Core budget for graph lists: up to cores // workers graphs are processed at once",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Directory for the results (outputs/<timestamp> by default). Graphs which already have results there are skipped",
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        type=int,
+        default=300,
+        help="Interval between BnB checkpoints in the output directory (in secs), 0 disables them",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        help="Checkpoint to continue the search of a single graph from (LP and ILP methods)",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        choices=TRACE_FORMATS,
+        default=None,
+        help="Write a BnB search trace (phase times, LP latencies, prune reasons, sampled nodes) to the output directory",
+    )
+    parser.add_argument(
+        "--trace_sample_rate",
+        type=int,
+        default=10,
+        help="Every n-th BnB node is recorded in the trace",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the heuristics, the independent sets and CPLEX",
+    )
     parser.add_argument(
         "-d", "--debug", action="store_true", help="Allow debug prints from cplex",
     )
 
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    # Checkpoints hold open nodes of the LP-based BnB, the coloring BnB can't continue them
+    if args.resume and args.method == "coloring":
+        parser.error("--resume can't be used with --method coloring")
+    return args
 
 
 def time_it(func):
@@ -83,15 +318,92 @@ def time_it(func):
     return wrap
 
 
+def get_clique_nodes(solution):
+    return np.flatnonzero(np.isclose(np.asarray(solution), 1.0, atol=1e-4))
+
+
+def get_clique_violation(graph, solution):
+    """
+    Pair of non-adjacent vertices of the solution, None if it's a clique
+    """
+    return graph.find_missing_edge(get_clique_nodes(solution))
+
+
 def check_clique(graph, solution, best_known_solution_size=None):
-    solution = np.array(solution)
-    clique_nodes = np.where(np.isclose(solution, 1.0, atol=1e-4))[0]
-    clique_candidate = graph.subgraph(clique_nodes)
-    num_nodes = len(clique_nodes)
+    clique_nodes = get_clique_nodes(solution)
     size_match = (
         len(clique_nodes) == best_known_solution_size
         if best_known_solution_size
         else None
     )
 
-    return clique_candidate.size() == num_nodes * (num_nodes - 1) / 2, size_match
+    return graph.is_clique(clique_nodes), size_match
+
+
+@contextmanager
+def quiet_logging():
+    """
+    INFO records of the block are dropped unless debug logging is on, so solvers of
+    subproblems only log at debug level
+    """
+    logger = logging.getLogger()
+    level = logger.level
+    if level > logging.DEBUG:
+        logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+class SearchResultsMixin:
+    """
+    Incumbent, best bound, gap and speed of a search. Solvers keep
+    best_found_clique_size, search_finished, call_times, search_timer and
+    best_found_time and define get_open_nodes_bound
+    """
+
+    # Open nodes bounds are LP values, which are floored with this tolerance
+    epsilon = 1e-3
+
+    def get_open_nodes_bound(self):
+        raise NotImplementedError
+
+    def get_best_bound(self):
+        if self.search_finished:
+            return self.best_found_clique_size
+        open_nodes_bound = self.get_open_nodes_bound()
+        if open_nodes_bound is None:
+            return None
+        return max(
+            self.best_found_clique_size, floor(open_nodes_bound + self.epsilon),
+        )
+
+    def get_gap(self):
+        best_bound = self.get_best_bound()
+        if best_bound is None:
+            return None
+        if best_bound == 0:
+            return 0.0
+        return (best_bound - self.best_found_clique_size) / best_bound
+
+    def get_nodes_per_second(self):
+        if self.search_timer is None:
+            return 0.0
+        elapsed = time.time() - self.search_timer
+        return self.call_times / elapsed if elapsed > 0 else 0.0
+
+    def get_time_to_best(self):
+        """
+        Seconds from the start of the search to the last incumbent update, None if
+        the search didn't improve the initial solution
+        """
+        if self.best_found_time is None or self.search_timer is None:
+            return None
+        return self.best_found_time - self.search_timer
+
+    def get_objective_value(self):
+        return self.best_found_clique_size
+
+    def set_objective_value(self, objective_value):
+        self.best_found_clique_size = objective_value